@@ -0,0 +1,61 @@
+"""Cold start benchmark for the gtasks entry point.
+
+Run it against one or more source trees to compare before and after a change:
+
+    git worktree add /tmp/gtasks-before <old-commit>
+    python benchmarks/startup.py /tmp/gtasks-before .
+"""
+
+# %% IMPORTS
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# %% CONFIGS
+
+SCENARIOS = {
+    "--list": ["--list"],
+    "single task": ["--dry", "cleans.python"],
+}
+
+SNIPPET = "import sys; from gtasks.main import program; program.run(['gtasks', *sys.argv[1:]])"
+
+# %% FUNCTIONS
+
+
+def measure(
+    tree: str,
+    argv: list[str],
+    repeat: int,
+) -> float:
+    """Return the median wall time in milliseconds of a fresh interpreter running gtasks."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", SNIPPET, *argv],
+            cwd=tree,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    """Print the cold start of every scenario for every source tree."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trees", nargs="*", default=["."], help="Source trees to benchmark.")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per scenario.")
+    args = parser.parse_args()
+
+    for name, argv in SCENARIOS.items():
+        for tree in args.trees:
+            print(f"{name:<12} {tree:<30} {measure(tree, argv, args.repeat):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
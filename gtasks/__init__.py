@@ -1,15 +1,27 @@
-from . import (
-    base,
-    branch,
-    cleans,
-    containers,
-    docs,
-    formats,
-    git,
-    installs,
-    issues,
-    main,
-    packages,
-    projects,
-    setup_repo,
-)
+import importlib
+
+# Submodules are imported on first attribute access so that `import gtasks`
+# stays cheap; see `main.NAMESPACES` for the task modules.
+__all__ = [
+    "base",
+    "branch",
+    "cleans",
+    "containers",
+    "docs",
+    "formats",
+    "git",
+    "installs",
+    "issues",
+    "main",
+    "packages",
+    "projects",
+    "setup_repo",
+]
+
+
+def __getattr__(
+    name: str,
+):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,25 +1,167 @@
+import os
+import re
+
 from invoke import run
 
+from .gitmeta import (
+    find_git_dirs,
+    read_config,
+)
 
-def get_owner_repo() -> tuple:
+# Remotes are tried in the same order as `gh` picks the base repository
+REMOTE_PRIORITY = [
+    "upstream",
+    "github",
+    "origin",
+]
+
+# https://host/owner/repo(.git), ssh://git@host(:port)/owner/repo(.git) and git@host:owner/repo(.git)
+REMOTE_URL = re.compile(
+    r"^(?:[a-z+]+://(?:[^@/]+@)?([^/:]+)(?::\d+)?/|[^@/]+@([^:/]+):)([^/]+)/([^/]+?)(?:\.git)?/?$"
+)
+
+# Like `gh`, only remotes on GitHub are considered; GH_HOST adds a GitHub Enterprise host
+GITHUB_HOSTS = {
+    "github.com",
+    "ssh.github.com",
+}
+
+# Resolved owner and repository per git config file, with the config mtime they were read at
+_cache = {}
+
+
+def find_git_config(
+    path: str = ".",
+) -> str | None:
     """
-    Get the owner and repository name.
-    This function uses the `gh` command to retrieve the owner and repository name.
+    Find the config file of the git repository containing a path.
+
+    Follows the `gitdir:` indirection of worktrees and submodules.
+
+    Args:
+        path (str, optional): The path to start from. Defaults to the current directory.
+
+    Returns:
+        str | None: The path of the config file, or None if it cannot be found.
+    """
+
+    dirs = find_git_dirs(path)
+    if dirs is None:
+        return None
+
+    return os.path.join(dirs.commondir, "config")
+
+
+def parse_remote_url(
+    url: str,
+) -> tuple | None:
+    """
+    Parse the owner and repository name from the remote URL of a GitHub repository.
+
+    Args:
+        url (str): An HTTPS, SSH or scp-like remote URL.
+
+    Returns:
+        tuple | None: A tuple containing the owner and repository name, or None if the URL is not recognized
+        or is not on GitHub (github.com or `GH_HOST`).
+    """
+
+    match = REMOTE_URL.match(url.strip())
+    if match is None:
+        return None
+
+    host = (match.group(1) or match.group(2)).lower()
+    hosts = GITHUB_HOSTS | {os.environ.get("GH_HOST", "").lower()} - {""}
+    if host not in hosts:
+        return None
+
+    return match.group(3, 4)
+
+
+def parse_git_config(
+    config_path: str,
+) -> tuple | None:
+    """
+    Get the owner and repository name from the remotes of a git config file.
+
+    Args:
+        config_path (str): The path of the git config file.
+
+    Returns:
+        tuple | None: A tuple containing the owner and repository name, or None if no remote can be parsed.
+    """
+
+    config = read_config(config_path)
+    if config is None:
+        return None
+
+    remotes = {
+        section[len('remote "') : -1]: config[section]
+        for section in config.sections()
+        if section.startswith('remote "') and section.endswith('"')
+    }
+    # A remote picked with `gh repo set-default` wins, then the usual names, then the others
+    names = [name for name, remote in remotes.items() if remote.get("gh-resolved") == "base"]
+    names += [name for name in REMOTE_PRIORITY if name in remotes]
+    names += sorted(remotes)
+
+    for name in names:
+        owner_repo = parse_remote_url(remotes[name].get("url") or "")
+        if owner_repo:
+            return owner_repo
+
+    return None
+
+
+def get_owner_repo_gh() -> tuple:
+    """
+    Get the owner and repository name with the `gh` command.
+
     Returns:
         tuple: A tuple containing the owner and repository name.
     """
-   
+
     owner = run(
-            "gh repo view --json owner --jq '.owner.login'",
-            hide=True,
-        ).stdout.strip()
+        "gh repo view --json owner --jq '.owner.login'",
+        hide=True,
+        in_stream=False,
+    ).stdout.strip()
 
     repo = run(
-            "gh api repos/:owner/:repo -q .name",
-            hide=True,
-        ).stdout.strip()
+        "gh api repos/:owner/:repo -q .name",
+        hide=True,
+        in_stream=False,
+    ).stdout.strip()
 
     return (
         owner,
         repo,
     )
+
+
+def get_owner_repo() -> tuple:
+    """
+    Get the owner and repository name.
+    The remotes in the git config are parsed locally and the result is cached until the config changes.
+    The `gh` command is only used when no remote URL can be parsed.
+    Returns:
+        tuple: A tuple containing the owner and repository name.
+    """
+
+    config_path = find_git_config()
+    if config_path is None:
+        return get_owner_repo_gh()
+
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except OSError:
+        return get_owner_repo_gh()
+
+    cached = _cache.get(config_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    owner_repo = parse_git_config(config_path) or get_owner_repo_gh()
+    _cache[config_path] = (mtime, owner_repo)
+
+    return owner_repo
@@ -0,0 +1,272 @@
+import dataclasses
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from . import (
+    options,
+)
+from .github import (
+    MAX_WORKERS,
+    graphql_strict,
+)
+from .issue_index import (
+    Issue,
+)
+from .manifest import (
+    cache_dir,
+)
+from .storage import (
+    write_json,
+)
+
+# This file contains the listing of issues across many repositories or a
+# whole organization. Issues are found with GraphQL issue searches, run
+# concurrently when the repositories do not fit in one search, and merged
+# as a stream. Each fetched page is cached on disk for a few minutes.
+
+# Seconds during which cached pages are used as they are
+AGGREGATE_TTL = 300
+
+# GitHub rejects search queries longer than 256 characters
+MAX_QUERY_LENGTH = 256
+
+SEARCH_QUERY = """
+query($search: String!, $after: String) {
+  search(query: $search, type: ISSUE, first: 100, after: $after) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      ... on Issue {
+        number
+        title
+        state
+        updatedAt
+        repository { nameWithOwner }
+        labels(first: 10) { nodes { name } }
+        assignees(first: 10) { nodes { login } }
+      }
+    }
+  }
+}
+"""
+
+
+def search_queries(
+    assignee: str = "@me",
+    org: str = None,
+    repos: List[str] = None,
+) -> List[str]:
+    """
+    Build the issue searches covering an organization or a set of repositories.
+
+    Args:
+        assignee (str, optional): "@me", a login, "none" for unassigned issues or "all-open" for any. Defaults to "@me".
+        org (str, optional): The organization or user owning the repositories.
+        repos (List[str], optional): The repositories, as "owner/repo".
+
+    Returns:
+        List[str]: The searches, each short enough for GitHub.
+    """
+
+    base = "is:issue is:open"
+    if assignee == "none":
+        base += " no:assignee"
+    elif assignee != "all-open":
+        base += f" assignee:{assignee}"
+
+    if org:
+        return [f"{base} org:{org}"]
+
+    queries = []
+    query = base
+    for repo in repos or []:
+        qualifier = f" repo:{repo}"
+        if query != base and len(query) + len(qualifier) > MAX_QUERY_LENGTH:
+            queries.append(query)
+            query = base
+        query += qualifier
+    if query != base:
+        queries.append(query)
+
+    return queries
+
+
+def page_path(
+    search: str,
+    after: Optional[str],
+) -> str:
+    """Get the path of a cached page of a search, identified by the cursor it starts after."""
+    digest = hashlib.sha1(f"{search}\n{after or ''}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), "aggregate", f"{digest}.json")
+
+
+def load_page(
+    path: str,
+) -> Optional[Dict[str, Any]]:
+    """Load a cached page, None if there is none or it is too old."""
+    try:
+        with open(
+            path,
+            "r",
+        ) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get("fetched_at", 0) > AGGREGATE_TTL:
+        return None
+
+    return data
+
+
+def fetch_page(
+    search: str,
+    after: Optional[str],
+) -> Dict[str, Any]:
+    """
+    Fetch a page of a search and cache it.
+
+    Args:
+        search (str): The search query.
+        after (str, optional): The cursor of the previous page, None for the first one.
+
+    Returns:
+        Dict[str, Any]: The `issues` of the page, as dictionaries, and the cursor of the `next` page (None on the last one).
+
+    Raises:
+        RuntimeError: If the search failed. Failed pages are not cached.
+    """
+
+    result = graphql_strict(SEARCH_QUERY, search=search, after=after).get("search")
+    if result is None:
+        raise RuntimeError(f"The issue search '{search}' returned no results field")
+
+    page_info = result.get("pageInfo") or {}
+    page = {
+        "issues": [
+            dataclasses.asdict(
+                Issue(
+                    number=node["number"],
+                    title=node["title"],
+                    state=node["state"].lower(),
+                    labels=[label["name"] for label in node["labels"]["nodes"]],
+                    assignees=[assignee["login"] for assignee in node["assignees"]["nodes"]],
+                    updated_at=node["updatedAt"],
+                    repo=node["repository"]["nameWithOwner"],
+                )
+            )
+            for node in result.get("nodes") or []
+            if node
+        ],
+        "next": page_info["endCursor"] if page_info.get("hasNextPage") else None,
+        "fetched_at": time.time(),
+    }
+    write_json(page_path(search, after), page)
+
+    return page
+
+
+def search_pages(
+    search: str,
+) -> Iterator[List[Issue]]:
+    """
+    Run an issue search, yielding each page of results as it arrives.
+
+    Each page is cached on its own as soon as it is fetched, so a caller that stops early (e.g.
+    `--limit`) still leaves the pages it read in the cache. Fresh cached pages are used unless
+    `--refresh` is given.
+
+    Args:
+        search (str): The search query.
+
+    Yields:
+        List[Issue]: The issues of each page, with their repository.
+
+    Raises:
+        RuntimeError: If the search failed.
+    """
+
+    after = None
+    while True:
+        page = None if options.refresh else load_page(page_path(search, after))
+        if page is None:
+            page = fetch_page(search, after)
+        yield [Issue(**issue) for issue in page["issues"]]
+        if page["next"] is None:
+            return
+        after = page["next"]
+
+
+def iter_aggregated(
+    assignee: str = "@me",
+    org: str = None,
+    repos: List[str] = None,
+) -> Iterator[Issue]:
+    """
+    Iterate over the open issues of an organization or a set of repositories.
+
+    The searches run concurrently and their pages are yielded as they arrive, in no particular
+    order. Pages are read from the cache when fresh.
+
+    Args:
+        assignee (str, optional): "@me", a login, "none" for unassigned issues or "all-open" for any. Defaults to "@me".
+        org (str, optional): The organization or user owning the repositories.
+        repos (List[str], optional): The repositories, as "owner/repo".
+
+    Yields:
+        Issue: The issues, with their repository.
+
+    Raises:
+        RuntimeError: If a search failed.
+    """
+
+    queries = search_queries(assignee, org, repos)
+    pages: queue.Queue = queue.Queue()
+    done = object()
+    stopped = threading.Event()
+
+    def run(search: str) -> None:
+        try:
+            for page in search_pages(search):
+                pages.put(page)
+                if stopped.is_set():
+                    return
+        except RuntimeError as error:
+            pages.put(error)
+        finally:
+            pages.put(done)
+
+    # Pages fetched at different times may overlap when issues changed in between
+    seen = set()
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    try:
+        for search in queries:
+            pool.submit(run, search)
+        remaining = len(queries)
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+                continue
+            if isinstance(page, RuntimeError):
+                raise page
+            for issue in page:
+                if (issue.repo, issue.number) not in seen:
+                    seen.add((issue.repo, issue.number))
+                    yield issue
+    finally:
+        # A caller that stops early (e.g. --limit) does not wait for the remaining pages
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,21 @@
 from typing import (
+    Dict,
     List,
 )
 
 import inquirer
-from invoke import (
-    run,
+
+from ._getowner import (
+    get_owner_repo,
+)
+from .cache import (
+    cached_list,
+)
+from .prefetch import (
+    result,
+)
+from .repo_context import (
+    get_repo_context,
 )
 
 # This script contains the base functions that are used in other scripts.
@@ -63,6 +74,180 @@ COMMIT_TYPES = [
 ]
 
 
+# Longer choice lists are narrowed down with a search before picking
+SEARCH_THRESHOLD = 20
+SEARCH_LIMIT = 30
+SEARCH_AGAIN = "[Search again]"
+
+
+def select_choice(
+    name: str,
+    message: str,
+    choices: List[str],
+) -> str:
+    """
+    Prompt the user to pick one of the choices.
+
+    Short lists are shown as they are. Longer lists first ask for a search text and only show the
+    choices containing it, so picking stays fast with thousands of choices.
+
+    Args:
+        name (str): The name of the answer.
+        message (str): The message of the prompt.
+        choices (List[str]): The choices to pick from.
+
+    Returns:
+        str: The selected choice.
+    """
+
+    matches = choices
+    while True:
+        if len(choices) > SEARCH_THRESHOLD:
+            search = inquirer.text(f"{message} - type to filter {len(choices)} choices").lower()
+            matches = [choice for choice in choices if search in choice.lower()]
+            exact = [choice for choice in matches if choice.lower() == search]
+            if exact:
+                return exact[0]
+            if not matches:
+                print(f"Nothing matches '{search}'.")
+                continue
+            matches = matches[:SEARCH_LIMIT] + [SEARCH_AGAIN]
+
+        selected = inquirer.prompt(
+            [
+                inquirer.List(
+                    name,
+                    message=message,
+                    choices=matches,
+                )
+            ]
+        )[name]
+        if selected != SEARCH_AGAIN:
+            return selected
+
+
+def group_paths(
+    paths: List[str],
+    prefix: str = "",
+) -> Dict[str, List[str]]:
+    """
+    Group paths by their first directory below a prefix.
+
+    Args:
+        paths (List[str]): The paths, all starting with the prefix.
+        prefix (str, optional): The directory being shown, ending with "/". Defaults to the root.
+
+    Returns:
+        Dict[str, List[str]]: The paths under each directory (keys ending with "/"), and each file directly in the prefix.
+    """
+
+    groups: Dict[str, List[str]] = {}
+    for path in paths:
+        head, slash, _ = path[len(prefix) :].partition("/")
+        groups.setdefault(prefix + head + slash, []).append(path)
+
+    return dict(sorted(groups.items()))
+
+
+def select_paths(
+    message: str,
+    paths: List[str],
+) -> List[str]:
+    """
+    Prompt the user to pick paths, grouped by directory.
+
+    Short lists are shown as a plain checkbox. Longer lists are shown one directory at a time, with
+    each subdirectory collapsed into one entry that selects all its paths. Directories can be opened,
+    and the list can be filtered by a search text, so picking stays fast with thousands of paths.
+
+    Args:
+        message (str): The message of the prompt.
+        paths (List[str]): The paths to pick from.
+
+    Returns:
+        List[str]: The selected paths, in the order given.
+    """
+
+    if len(paths) <= SEARCH_THRESHOLD:
+        return inquirer.prompt(
+            [
+                inquirer.Checkbox(
+                    "paths",
+                    message=message,
+                    choices=paths,
+                )
+            ]
+        )["paths"]
+
+    def descend(
+        visible: List[str],
+        prefix: str,
+    ) -> str:
+        # Skip directories holding a single entry
+        groups = group_paths(visible, prefix)
+        while len(groups) == 1 and next(iter(groups)).endswith("/"):
+            prefix = next(iter(groups))
+            groups = group_paths(visible, prefix)
+        return prefix
+
+    selected = set()
+    prefix = ""
+    search = ""
+    while True:
+        visible = [path for path in paths if search in path.lower()]
+        if not visible:
+            print(f"Nothing matches '{search}'.")
+            search = ""
+            continue
+        top = descend(visible, "")
+        prefix = descend([path for path in visible if path.startswith(prefix)], prefix) if prefix else top
+        groups = group_paths([path for path in visible if path.startswith(prefix)], prefix)
+
+        choices = [
+            (f"{name} ({len(group)} files)" if name.endswith("/") else name, name)
+            for name, group in groups.items()
+        ]
+        location = prefix or "."
+        if search:
+            location += f", matching '{search}'"
+        checked = inquirer.prompt(
+            [
+                inquirer.Checkbox(
+                    "paths",
+                    message=f"{message} in {location}",
+                    choices=choices,
+                    default=[name for name, group in groups.items() if selected.issuperset(group)],
+                )
+            ]
+        )["paths"]
+        for name, group in groups.items():
+            if name in checked:
+                selected.update(group)
+            else:
+                selected.difference_update(group)
+
+        directories = [name for name in groups if name.endswith("/")]
+        actions = [f"Done ({len(selected)} selected)"]
+        if directories:
+            actions.append("Open a directory")
+        if prefix != top:
+            actions.append("Go up")
+        actions.append("Filter")
+        action = inquirer.list_input("What next?", choices=actions)
+
+        if action == "Open a directory":
+            prefix = select_choice("directory", "Open a directory", directories)
+        elif action == "Go up":
+            prefix = prefix[: prefix.rstrip("/").rfind("/") + 1]
+            while prefix and prefix != top and len(group_paths([path for path in visible if path.startswith(prefix)], prefix)) == 1:
+                prefix = prefix[: prefix.rstrip("/").rfind("/") + 1]
+        elif action == "Filter":
+            search = inquirer.text("Show the paths containing (empty for all)", default="").lower()
+            prefix = ""
+        else:
+            return [path for path in paths if path in selected]
+
+
 def parse_collaborators(
     owner: str,
     repo: str,
@@ -78,11 +263,12 @@ def parse_collaborators(
         List[str]: A list containing the collaborators of the repository.
     """
 
-    result = run(f"gh api repos/{owner}/{repo}/collaborators --jq '.[].login'")
-
-    collaborators = result.stdout.strip().split("\n")
-
-    return [collaborator for collaborator in collaborators]
+    return cached_list(
+        owner,
+        repo,
+        "collaborators",
+        lambda: get_repo_context(owner, repo).collaborators,
+    )
 
 
 def get_assignee(
@@ -99,38 +285,61 @@ def get_assignee(
         str: The assignee for the issue.
     """
 
-    collaborators = parse_collaborators(
+    collaborators = result(
+        parse_collaborators,
         owner,
         repo,
     )
-    return inquirer.prompt(
-        [
-            inquirer.List(
-                "assignee",
-                message="Select an assignee",
-                choices=[collaborator for collaborator in collaborators],
-            )
-        ]
-    )["assignee"]
+    return select_choice(
+        "assignee",
+        "Select an assignee",
+        collaborators,
+    )
+
+def get_labels(
+    owner: str,
+    repo: str,
+) -> List[str]:
+    """
+    Get the label names of a repository.
+    The labels are cached on disk and fetched page by page on first use.
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+    Returns:
+        List[str]: The names of the labels.
+    """
+
+    labels = cached_list(
+        owner,
+        repo,
+        "labels",
+        lambda: get_repo_context(owner, repo).labels,
+    )
+
+    return [label["name"] for label in labels]
+
 
 def get_label_selected():
     """
     Get the selected label.
-    This function uses the `gh` command to retrieve the labels of a repository.
+    The labels of the current repository are used, prefetched if `get_labels` was prefetched.
     Returns:
         str: The selected
     """
 
-    result = run("gh label list").stdout.strip().split("\n")
-
-    labels = [line.split("\t")[0] for line in result]
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    labels = result(
+        get_labels,
+        owner,
+        repo,
+    )
 
-    return inquirer.prompt(
-        [
-            inquirer.List(
-                "label",
-                message="Select the label",
-                choices=[label for label in labels],
-            )
-        ]
-    )["label"]
+    return select_choice(
+        "label",
+        "Select the label",
+        labels,
+    )
@@ -1,6 +1,16 @@
+import os
+import re
+import shlex
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
 import inquirer
 from invoke import (
     Collection,
+    Exit,
     run,
 )
 from invoke.context import (
@@ -10,52 +20,302 @@ from invoke.tasks import (
     task,
 )
 
+from ._getowner import (
+    get_owner_repo,
+)
+from .base import (
+    get_labels,
+)
+from .github import (
+    api,
+    graphql_strict,
+)
+from .gitmeta import (
+    read_branch,
+)
+from .issue_index import (
+    Issue,
+    branch_issues,
+    closed_issues,
+    ensure_synced,
+    get_issue,
+    issue_branches,
+    link_branch,
+    store_issue,
+    unlink_branches,
+)
+
 # This file contains scripts related to branch activities.
 
+# Branches that are never pruned
+PROTECTED_BRANCHES = {
+    "main",
+    "master",
+    "develop",
+}
+
+# Branch names created by `branch.new`: <label>/<issue>-<name>
+ISSUE_BRANCH = re.compile(r"^([^/]+)/(\d+)-")
+
+# Creates a branch on GitHub and links it to an issue, as `gh issue develop` does
+LINK_BRANCH_MUTATION = """
+mutation($issue: ID!, $oid: GitObjectID!, $name: String!) {
+  createLinkedBranch(input: {issueId: $issue, oid: $oid, name: $name}) {
+    linkedBranch { id }
+  }
+}
+"""
+
 
 def git_current_branch() -> str:
     """
     Get the current branch name.
-    This function uses the `git` command to retrieve the current branch name.
+    The branch is read from the HEAD file, and the `git` command is only used for layouts it does not handle.
     Returns:
         str: The name of the current branch.
     """
 
-    return run("git symbolic-ref --short HEAD").stdout.strip()
+    return read_branch() or run("git symbolic-ref --short HEAD").stdout.strip()
+
+
+def branch_issue(
+    branch: str,
+    labels: List[str],
+) -> Optional[int]:
+    """
+    Get the issue of a branch named like `branch.new` names them.
+
+    Only names starting with a label of the repository count, so branches such as `release/2024-q1`
+    are not taken for the branch of an issue.
+
+    Args:
+        branch (str): The name of the branch.
+        labels (List[str]): The labels of the repository.
+
+    Returns:
+        Optional[int]: The issue number, or None if the name does not follow `<label>/<issue>-<name>`.
+    """
+
+    match = ISSUE_BRANCH.match(branch)
+    if match is None or match.group(1) not in labels:
+        return None
+
+    return int(match.group(2))
+
+
+def quote_all(
+    names: List[str],
+) -> str:
+    """
+    Quote names for a shell command line.
+
+    Branch names come from the remote and may hold shell syntax, e.g. `x$(cmd)`, which git accepts.
+
+    Args:
+        names (List[str]): The names, e.g. of branches.
+
+    Returns:
+        str: The quoted names, separated by spaces.
+    """
+
+    return " ".join(shlex.quote(name) for name in names)
+
+
+def list_refs() -> tuple:
+    """
+    List the local branches and the branches of origin with one `git for-each-ref`.
+
+    Returns:
+        tuple: The names of the local branches and of the branches of origin.
+    """
+
+    refs = run(
+        "git for-each-ref --format='%(refname)' refs/heads refs/remotes/origin",
+        hide=True,
+        in_stream=False,
+    ).stdout.split()
+    local = [ref[len("refs/heads/") :] for ref in refs if ref.startswith("refs/heads/")]
+    remote = [ref[len("refs/remotes/origin/") :] for ref in refs if ref.startswith("refs/remotes/origin/")]
+
+    return (
+        local,
+        [branch for branch in remote if branch != "HEAD"],
+    )
+
+
+def delete_branches(
+    branches: List[str],
+) -> None:
+    """
+    Delete branches locally and on origin, each side in one batched call.
+
+    If the current branch is deleted, `main` is checked out first, or, in a linked worktree, the worktree is removed
+    from the main one. Only the branches that exist are deleted.
+
+    Args:
+        branches (List[str]): The names of the branches.
+    """
+
+    (
+        local,
+        remote,
+    ) = list_refs()
+    local_branches = [branch for branch in branches if branch in local]
+    remote_branches = [branch for branch in branches if branch in remote]
+
+    if local_branches:
+        current = git_current_branch()
+        if current in local_branches:
+            worktrees = list_worktrees()
+            if current == worktrees[0]["branch"]:
+                run("git checkout main")
+            else:
+                # `main` is checked out in the main worktree, so this worktree goes instead
+                os.chdir(worktrees[0]["path"])
+                print(f"The current worktree is removed, continue in {worktrees[0]['path']}")
+        remove_worktrees(local_branches)
+        print(f"Deleting local branches: {' '.join(local_branches)}")
+        run(f"git branch -d {quote_all(local_branches)}", warn=True)
+    if remote_branches:
+        print(f"Deleting remote branches: {' '.join(remote_branches)}")
+        run(f"git push origin --delete {quote_all(remote_branches)}", warn=True)
 
 
 def delete_branch() -> None:
     """
     Delete the current branch.
-    This function uses the `git` command to delete the current branch.
+    This function uses the `git` command to delete the current branch locally and on origin.
     Returns:
         None
     """
-    branch = git_current_branch()
-    run("git checkout main")
 
-    print("Deleting branch local branch")
-    run(f"git branch -d {branch}")
-    print("Deleting branch remote branch")
-    run(f"git push origin --delete {branch}")
+    delete_branches([git_current_branch()])
+
+
+def delete_issue_branches(
+    owner: str,
+    repo: str,
+    issue_id: int,
+) -> None:
+    """
+    Delete the branches of an issue, locally and on origin.
+
+    The branches are the ones recorded by `branch.new`, and any branch following its naming, `<label>/<issue_id>-<name>`
+    with a label of the repository.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        issue_id (int): The number of the issue.
+    """
+
+    (
+        local,
+        remote,
+    ) = list_refs()
+    labels = get_labels(owner, repo)
+    branches = issue_branches(owner, repo, int(issue_id))
+    branches += sorted(
+        {
+            branch
+            for branch in local + remote
+            if branch_issue(branch, labels) == int(issue_id) and branch not in branches
+        }
+    )
+    if not branches:
+        print(f"No branches found for issue {issue_id}")
+        return
+
+    delete_branches(branches)
+    unlink_branches(owner, repo, branches)
+
+
+def list_worktrees() -> List[Dict[str, str]]:
+    """
+    List the worktrees of the repository.
+
+    Returns:
+        List[Dict[str, str]]: The `path` and `branch` (empty when detached) of each worktree, the main one first.
+    """
+
+    output = run(
+        "git worktree list --porcelain",
+        hide=True,
+        in_stream=False,
+    ).stdout
+    worktrees = []
+    for block in output.strip().split("\n\n"):
+        fields = dict(line.partition(" ")[::2] for line in block.splitlines())
+        if "worktree" in fields:
+            worktrees.append(
+                {
+                    "path": fields["worktree"],
+                    "branch": fields.get("branch", "").removeprefix("refs/heads/"),
+                }
+            )
+
+    return worktrees
+
+
+def worktree_path(
+    branch: str,
+) -> str:
+    """
+    Get the directory of the worktree of a branch.
+
+    Worktrees live next to the main one, in `<repo>-worktrees/<branch>` with slashes replaced by dashes.
+
+    Args:
+        branch (str): The name of the branch.
+
+    Returns:
+        str: The path of the worktree.
+    """
+
+    main = list_worktrees()[0]["path"]
+
+    return os.path.join(f"{main}-worktrees", branch.replace("/", "-"))
+
+
+def remove_worktrees(
+    branches: List[str],
+) -> None:
+    """
+    Remove the worktrees where branches are checked out, so the branches can be deleted.
+
+    The main worktree is never removed.
+
+    Args:
+        branches (List[str]): The names of the branches.
+    """
+
+    for worktree in list_worktrees()[1:]:
+        if worktree["branch"] in branches:
+            print(f"Removing worktree {worktree['path']}")
+            run(f"git worktree remove {shlex.quote(worktree['path'])}", warn=True)
+    run("git worktree prune", hide=True, in_stream=False)
 
 
 @task(
     help={
-        "issue_id": "The ID of the issue to create a branch from. If not provided, use `gtasks issues.list` to get the issue ID."
+        "issue_id": "The ID of the issue to create a branch from. If not provided, use `gtasks issues.list` to get the issue ID.",
+        "worktree": "Check out the branch in its own worktree instead of the current directory",
     }
 )
 def new(
     _: Context,
     issue_id: int = None,
+    worktree: bool = False,
 ) -> None:
     """
     Create a new branch based on a GitHub issue.
-    This function interacts with the GitHub CLI to create a new branch based on the provided issue ID.
-    If no issue ID is provided, it prompts the user to enter one. It then retrieves the labels of the issue,
-    constructs a branch name, and creates a new branch based on the issue.
+    This function creates a new branch from `origin/main` based on the provided issue ID, links it to the issue on GitHub,
+    and records it in the issue index. If no issue ID is provided, it prompts the user to enter one. It then retrieves the
+    labels of the issue, from the index when possible, constructs a branch name, and creates and checks out the branch in
+    one git call. The branch is linked with one GraphQL mutation, which also creates it on origin.
     Args:
         issue_id (int, optional): The ID of the GitHub issue. If not provided, the user will be prompted to enter it.
+        worktree (bool, optional): Check out the branch in its own worktree, sharing the object store, so switching issues is a `cd`.
     Returns:
         None
     """
@@ -63,19 +323,281 @@ def new(
     if issue_id is None:
         issue_id = inquirer.text("Enter the issue ID")
         issue_id = issue_id.split(" ")[0]
-    label = run(
-        f"gh issue view {issue_id} --json labels --jq '.labels[].name'",
-        hide=True,
-    ).stdout.split()[0]
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+
+    # The issue index usually knows the labels; otherwise fetch the issue once
+    issue = get_issue(owner, repo, int(issue_id))
+    if issue is None or not issue.node_id:
+        response = api(
+            "GET",
+            f"repos/{owner}/{repo}/issues/{issue_id}",
+        )
+        if response.status != 200:
+            raise Exit(f"Could not get issue {issue_id}: {response.status} {response.body}")
+        item = response.json()
+        store_issue(owner, repo, item)
+        issue = Issue.from_item(item)
+    if not issue.labels:
+        raise Exit(f"Issue {issue_id} has no label to name the branch after")
+    label = issue.labels[0]
     branch_name = inquirer.text("Enter the branch name [Make is similar to the issue title]")
     branch_name = f"{label}/{issue_id}-{branch_name}"
 
-    run(f"gh issue develop {issue_id} --name {branch_name} --base main --checkout")
+    run("git fetch origin main", hide=True, in_stream=False)
+    oid = run("git rev-parse origin/main", hide=True, in_stream=False).stdout.strip()
+    try:
+        graphql_strict(
+            LINK_BRANCH_MUTATION,
+            issue=issue.node_id,
+            oid=oid,
+            name=branch_name,
+        )
+    except RuntimeError as error:
+        print(f"Could not link {branch_name} to issue {issue_id}: {error}")
+
+    if worktree:
+        path = worktree_path(branch_name)
+        run(f"git worktree add --no-track -b {shlex.quote(branch_name)} {shlex.quote(path)} origin/main")
+        print(f"cd {shlex.quote(path)}")
+    else:
+        run(f"git checkout --no-track -b {shlex.quote(branch_name)} origin/main")
+    link_branch(owner, repo, int(issue_id), branch_name)
+
+
+def find_prunable(
+    owner: str,
+    repo: str,
+    base: str = "main",
+) -> Dict[str, Dict[str, str]]:
+    """
+    Find the branches merged into the base branch or belonging to a closed issue.
+
+    Every ref is listed with one `git for-each-ref`, and the merged ones with one `git for-each-ref --merged`.
+    Branches still pointing at the base branch, e.g. just created, are not considered merged.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        base (str, optional): The branch others are merged into. Defaults to "main".
+
+    Returns:
+        Dict[str, Dict[str, str]]: The reason to prune each branch, on the "local" and "remote" sides where it exists.
+        Reasons of branches that may hold unmerged work end with "(by name)" when the issue was only guessed
+        from the branch name.
+    """
+
+    (
+        local,
+        remote,
+    ) = list_refs()
+    merged = set(
+        run(
+            f"git for-each-ref --format='%(refname)' --merged={shlex.quote(base)} --no-contains={shlex.quote(base)} refs/heads",
+            hide=True,
+            in_stream=False,
+        ).stdout.split()
+    )
+    merged |= set(
+        run(
+            f"git for-each-ref --format='%(refname)' --merged={shlex.quote(f'origin/{base}')} --no-contains={shlex.quote(f'origin/{base}')} refs/remotes/origin",
+            hide=True,
+            in_stream=False,
+            warn=True,
+        ).stdout.split()
+    )
+    try:
+        ensure_synced(owner, repo)
+    except RuntimeError as error:
+        raise Exit(str(error))
+    closed = closed_issues(owner, repo)
+    issues = branch_issues(owner, repo)
+    labels = get_labels(owner, repo)
+    current = git_current_branch()
+
+    def reason(
+        branch: str,
+        ref: str,
+    ) -> str | None:
+        if branch in PROTECTED_BRANCHES or branch in (base, current):
+            return None
+        if ref in merged:
+            return f"merged into {base}"
+        if issues.get(branch) in closed:
+            return f"issue {issues[branch]} closed"
+        issue = branch_issue(branch, labels)
+        if issue in closed:
+            return f"issue {issue} closed (by name)"
+        return None
+
+    prunable: Dict[str, Dict[str, str]] = {}
+    for side, branches, prefix in (
+        ("local", local, "refs/heads/"),
+        ("remote", remote, "refs/remotes/origin/"),
+    ):
+        for branch in branches:
+            why = reason(branch, prefix + branch)
+            if why:
+                prunable.setdefault(branch, {})[side] = why
+
+    return prunable
+
+
+@task(
+    help={
+        "base": "The branch others are merged into. Defaults to 'main'.",
+        "dry_run": "Only report the branches that would be deleted",
+    }
+)
+def prune(
+    _: Context,
+    base: str = "main",
+    dry_run: bool = False,
+) -> None:
+    """
+    Delete merged and stale branches.
+
+    This function finds the local and origin branches merged into the base branch, or created for an issue that is now closed, and reports them. After confirmation, it deletes the remote ones with one `git push origin --delete`, and the local ones with one `git branch -D`. Local branches only linked to their issue by their name are deleted with `git branch -d`, which keeps them if they hold unmerged work.
+
+    Args:
+        base (str, optional): The branch others are merged into. Defaults to "main".
+        dry_run (bool, optional): Only report the branches that would be deleted. Defaults to False.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    prunable = find_prunable(owner, repo, base)
+    if not prunable:
+        print("No branches to prune")
+        return
+
+    for branch, sides in sorted(prunable.items()):
+        where = "+".join(sides)
+        print(f"{branch:<50} {where:<13} {next(iter(sides.values()))}")
+
+    local_branches = sorted(branch for branch, sides in prunable.items() if "local" in sides)
+    remote_branches = sorted(branch for branch, sides in prunable.items() if "remote" in sides)
+    print(f"{len(local_branches)} local and {len(remote_branches)} remote branches to delete")
+    if dry_run or not inquirer.confirm(
+        "Delete these branches?",
+        default=False,
+    ):
+        return
+
+    if local_branches:
+        remove_worktrees(local_branches)
+        guessed = [branch for branch in local_branches if prunable[branch]["local"].endswith("(by name)")]
+        known = [branch for branch in local_branches if branch not in guessed]
+        if known:
+            run(f"git branch -D {quote_all(known)}", warn=True)
+        if guessed:
+            run(f"git branch -d {quote_all(guessed)}", warn=True)
+    if remote_branches:
+        run(f"git push origin --delete {quote_all(remote_branches)}", warn=True)
+    unlink_branches(owner, repo, sorted(prunable))
+
+
+@task
+def worktrees(
+    _: Context,
+) -> None:
+    """
+    List the worktrees of the repository.
+
+    This function prints the branch and the path of every worktree, with the issue of the branch when there is one.
+
+    Returns:
+        None
+    """
+
+    for worktree in list_worktrees():
+        match = ISSUE_BRANCH.match(worktree["branch"])
+        issue = f"#{match.group(2)}" if match else ""
+        print(f"{issue:<8} {worktree['branch'] or '(detached)':<50} {worktree['path']}")
+
+
+@task(
+    help={
+        "target": "The issue ID or the branch name",
+    }
+)
+def jump(
+    _: Context,
+    target: str,
+) -> None:
+    """
+    Print the path of the worktree of an issue or a branch.
+
+    Use it to switch issues with `cd $(gtasks branch.jump 12)`.
+
+    Args:
+        target (str): The issue ID or the branch name.
+
+    Returns:
+        None
+    """
+
+    for worktree in list_worktrees():
+        match = ISSUE_BRANCH.match(worktree["branch"])
+        if worktree["branch"] == target or (match and match.group(2) == target.lstrip("#")):
+            print(worktree["path"])
+            return
+
+    raise Exit(f"No worktree for {target}")
+
+
+@task(
+    help={
+        "base": "The branch others are merged into. Defaults to 'main'.",
+        "dry_run": "Only report the worktrees that would be removed",
+    }
+)
+def gc(
+    _: Context,
+    base: str = "main",
+    dry_run: bool = False,
+) -> None:
+    """
+    Remove the worktrees of merged and closed-issue branches.
+
+    This function finds the worktrees whose branch `branch.prune` would delete, removes them, and drops the records of worktrees whose directory is gone. The branches themselves are kept; use `branch.prune` to delete them.
+
+    Args:
+        base (str, optional): The branch others are merged into. Defaults to "main".
+        dry_run (bool, optional): Only report the worktrees that would be removed. Defaults to False.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    prunable = find_prunable(owner, repo, base)
+    stale = [worktree for worktree in list_worktrees()[1:] if "local" in prunable.get(worktree["branch"], {})]
+    for worktree in stale:
+        print(f"{worktree['branch']:<50} {worktree['path']}  {prunable[worktree['branch']]['local']}")
+    if not stale:
+        print("No worktrees to remove")
+    if dry_run:
+        return
 
-    run(f"git checkout -b {branch_name}")
+    remove_worktrees([worktree["branch"] for worktree in stale])
 
 
 namespace = Collection(
     "branch",
+    gc,
+    jump,
     new,
+    prune,
+    worktrees,
 )
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+from .github import (
+    MAX_WORKERS,
+    Response,
+)
+from .manifest import (
+    cache_dir,
+)
+from .storage import (
+    write_json,
+)
+
+# This file contains the runner of bulk operations on many issues. Items
+# run in a bounded worker pool (the GitHub scheduler also bounds requests
+# in flight), each one is reported as it finishes, and finished items are
+# recorded in a journal so an interrupted or partially failed run can be
+# resumed by running the same command again.
+
+ID_RANGE = re.compile(r"^(\d+)(?:-(\d+))?$")
+
+
+def parse_ids(
+    ids: str,
+) -> List[int]:
+    """
+    Parse a list of issue IDs.
+
+    Args:
+        ids (str): IDs and ranges separated by commas or spaces, e.g. "12,15 20-30".
+
+    Returns:
+        List[int]: The issue numbers, in order and without duplicates.
+
+    Raises:
+        ValueError: If a part is neither an ID nor a range.
+    """
+
+    numbers: Dict[int, None] = {}
+    for part in re.split(r"[,\s]+", ids.strip()):
+        if not part:
+            continue
+        match = ID_RANGE.match(part.lstrip("#"))
+        if match is None:
+            raise ValueError(f"Not an issue ID or range: {part}")
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        for number in range(start, end + 1):
+            numbers[number] = None
+
+    return [*numbers]
+
+
+def journal_path(
+    owner: str,
+    repo: str,
+    key: Dict[str, Any],
+) -> str:
+    """
+    Get the path of the journal of a bulk operation.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        key (Dict[str, Any]): What identifies the operation, e.g. its action, issues and arguments.
+
+    Returns:
+        str: The path of the journal under the gtasks cache directory.
+    """
+
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    return os.path.join(cache_dir(), "repos", owner, repo, "bulk", f"{digest}.json")
+
+
+def load_journal(
+    path: str,
+) -> List[int]:
+    """Load the items a previous run of the operation already finished."""
+    try:
+        with open(
+            path,
+            "r",
+        ) as file:
+            return json.load(file)["done"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def store_journal(
+    path: str,
+    done: List[int],
+) -> None:
+    """Store the finished items of the operation. Errors are ignored, the journal is only a convenience."""
+    write_json(path, {"done": done})
+
+
+def run_bulk(
+    owner: str,
+    repo: str,
+    action: str,
+    numbers: List[int],
+    operation: Callable[[int], Response],
+    expected: int = 200,
+    key: Optional[Dict[str, Any]] = None,
+) -> List[int]:
+    """
+    Run an operation on many issues concurrently.
+
+    Issues finished by a previous run of the same operation are skipped. The journal is removed
+    once every issue succeeded.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        action (str): What the operation does, e.g. "closed", used in the report.
+        numbers (List[int]): The issue numbers.
+        operation (Callable[[int], Response]): Sends the request for one issue.
+        expected (int, optional): The status of a successful request. Defaults to 200.
+        key (Dict[str, Any], optional): The arguments of the operation, to tell runs apart in the journal.
+
+    Returns:
+        List[int]: The issues that failed.
+    """
+
+    path = journal_path(owner, repo, {"action": action, "numbers": numbers, **(key or {})})
+    done = load_journal(path)
+    finished = set(done)
+    pending = [number for number in numbers if number not in finished]
+    if done:
+        print(f"Resuming: {len(numbers) - len(pending)} of {len(numbers)} issues already {action}")
+
+    lock = threading.Lock()
+    failed: List[int] = []
+
+    def work(number: int) -> None:
+        response = operation(number)
+        with lock:
+            if response.status == expected:
+                done.append(number)
+                store_journal(path, done)
+                print(f"{number}: {action}")
+            else:
+                failed.append(number)
+                print(f"{number}: failed ({response.status} {response.body.strip()[:200]})")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        list(pool.map(work, pending))
+
+    print(f"{len(pending) - len(failed)} issues {action}, {len(failed)} failed")
+    if failed:
+        print("Run the same command again to retry the failed issues")
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    return sorted(failed)
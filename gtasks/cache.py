@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+from . import (
+    options,
+)
+from .github import (
+    fetch_pages,
+)
+from .manifest import (
+    cache_dir,
+)
+from .storage import (
+    write_json,
+)
+
+# This file contains the on-disk cache of slowly changing GitHub data
+# (labels, collaborators), kept per owner/repo. Fresh entries are used as
+# is; stale entries are returned right away and revalidated in the
+# background with conditional requests, so an unchanged page costs a 304
+# that does not count against the rate limit.
+
+TTL_ENV_VAR = "GTASKS_CACHE_TTL"
+DEFAULT_TTL = 3600
+
+# REST endpoints of the cached lists, and how to keep only what the prompts need
+ENDPOINTS: Dict[str, tuple] = {
+    "labels": (
+        "repos/{owner}/{repo}/labels",
+        lambda items: [
+            {
+                "name": item["name"],
+                "color": item["color"],
+                "description": item.get("description") or "",
+            }
+            for item in items
+        ],
+    ),
+    "collaborators": (
+        "repos/{owner}/{repo}/collaborators",
+        lambda items: [item["login"] for item in items],
+    ),
+}
+
+
+def ttl() -> int:
+    """
+    Get the time to live of cache entries.
+
+    Returns:
+        int: The TTL in seconds, from `GTASKS_CACHE_TTL` or one hour by default.
+    """
+
+    try:
+        return int(os.environ.get(TTL_ENV_VAR, DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def entry_path(
+    owner: str,
+    repo: str,
+    name: str,
+) -> str:
+    """
+    Get the path of a cache entry.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        name (str): The name of the cached list, e.g. "labels".
+
+    Returns:
+        str: The path of the entry under the gtasks cache directory.
+    """
+
+    return os.path.join(cache_dir(), "repos", owner, repo, f"{name}.json")
+
+
+def load_entry(
+    owner: str,
+    repo: str,
+    name: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Load a cache entry.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        name (str): The name of the cached list.
+
+    Returns:
+        Optional[Dict[str, Any]]: The entry with its `pages` and `fetched_at`, or None if there is none.
+    """
+
+    try:
+        with open(
+            entry_path(owner, repo, name),
+            "r",
+        ) as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    return entry if "pages" in entry else None
+
+
+def entry_data(
+    entry: Dict[str, Any],
+) -> list:
+    """
+    Get the items of a cache entry.
+
+    Args:
+        entry (Dict[str, Any]): The cache entry.
+
+    Returns:
+        list: The items of every cached page, in order.
+    """
+
+    return [item for page in entry["pages"] for item in page["data"]]
+
+
+def store_entry(
+    owner: str,
+    repo: str,
+    name: str,
+    pages: List[Dict[str, Any]],
+) -> None:
+    """
+    Store a cache entry. Errors are ignored, the cache is only an optimization.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        name (str): The name of the cached list.
+        pages (List[Dict[str, Any]]): The pages of the list, each with its `etag` and `data`.
+    """
+
+    write_json(
+        entry_path(owner, repo, name),
+        {"pages": pages, "fetched_at": time.time()},
+    )
+
+
+def revalidate(
+    owner: str,
+    repo: str,
+    name: str,
+    entry: Optional[Dict[str, Any]] = None,
+) -> Optional[Any]:
+    """
+    Fetch a list again, conditionally on the ETags of the cached pages.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        name (str): The name of the cached list.
+        entry (Dict[str, Any], optional): The cached entry, if any.
+
+    Returns:
+        Optional[Any]: The up-to-date data, or None if the request failed.
+    """
+
+    endpoint, transform = ENDPOINTS[name]
+    pages = fetch_pages(
+        endpoint.format(owner=owner, repo=repo),
+        transform,
+        (entry or {}).get("pages", []),
+    )
+    if pages is None:
+        return None
+
+    store_entry(owner, repo, name, pages)
+
+    return entry_data({"pages": pages})
+
+
+def cached_list(
+    owner: str,
+    repo: str,
+    name: str,
+    fetch: Callable[[], Any],
+) -> Any:
+    """
+    Get a cached list of a repository.
+
+    Fresh entries are returned as is. Stale entries are returned right away and revalidated in the
+    background. With `--refresh`, the entry is revalidated before returning.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        name (str): The name of the cached list, "labels" or "collaborators".
+        fetch (Callable[[], Any]): Fetches the list if the paginated requests fail and nothing is cached.
+
+    Returns:
+        Any: The cached list.
+    """
+
+    entry = load_entry(owner, repo, name)
+
+    if entry is None:
+        data = revalidate(owner, repo, name)
+        return fetch() if data is None else data
+
+    if options.refresh:
+        data = revalidate(owner, repo, name, entry)
+        return entry_data(entry) if data is None else data
+
+    if time.time() - entry.get("fetched_at", 0) > ttl():
+        threading.Thread(target=revalidate, args=(owner, repo, name, entry)).start()
+
+    return entry_data(entry)
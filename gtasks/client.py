@@ -0,0 +1,92 @@
+import json
+import os
+import signal
+import socket
+import sys
+
+# This file contains the thin gtasks client. It only uses the standard
+# library so that it starts in a few milliseconds, and forwards argv, the
+# terminal and the cwd to the gtasks daemon (see daemon.py). When no daemon
+# is running it runs gtasks in-process instead.
+
+INTERRUPT = b"\x03"
+
+
+def socket_path() -> str:
+    """
+    Get the path of the daemon socket.
+
+    Returns:
+        str: `$XDG_RUNTIME_DIR/gtasks.sock`, or `gtasks/daemon.sock` under the user cache dir.
+    """
+
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "gtasks.sock")
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(root, "gtasks", "daemon.sock")
+
+
+def send_request(
+    sock: socket.socket,
+    request: dict,
+    fds: list[int] | None = None,
+) -> None:
+    """
+    Send a length-prefixed JSON request, optionally passing file descriptors along.
+
+    Args:
+        sock (socket.socket): The connection to the daemon.
+        request (dict): The request to send.
+        fds (list[int], optional): File descriptors to pass to the daemon.
+    """
+
+    payload = json.dumps(request).encode()
+    socket.send_fds(sock, [len(payload).to_bytes(4, "big") + payload], fds or [])
+
+
+def run_locally() -> None:
+    """Run gtasks in this process."""
+
+    from .main import program
+
+    program.run()
+
+
+def main() -> None:
+    """
+    Forward the command line to the daemon and exit with the task's exit code.
+
+    The daemon runs the task with this process' stdin, stdout and stderr, so prompts work as usual.
+    """
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path())
+    except OSError:
+        return run_locally()
+
+    send_request(
+        sock,
+        {
+            "command": "run",
+            "argv": sys.argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+        },
+        [0, 1, 2],
+    )
+
+    # The task does not run in our process group, so forward Ctrl-C to it
+    signal.signal(signal.SIGINT, lambda *_: sock.send(INTERRUPT))
+    reply = sock.makefile("rb").readline().decode().split()
+    sock.close()
+
+    if reply == ["stale"]:
+        # The daemon was started from older gtasks sources and is shutting down
+        return run_locally()
+    sys.exit(int(reply[1]) if len(reply) == 2 and reply[0] == "exit" else 1)
+
+
+if __name__ == "__main__":
+    main()
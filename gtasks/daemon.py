@@ -0,0 +1,300 @@
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import traceback
+
+from invoke import (
+    Collection,
+)
+from invoke.context import (
+    Context,
+)
+from invoke.tasks import (
+    task,
+)
+
+from . import (
+    manifest,
+)
+from .client import (
+    INTERRUPT,
+    send_request,
+    socket_path,
+)
+
+# This file contains the gtasks daemon. It imports every task module once
+# and forks a warm child per client request; the child takes over the
+# client's stdin, stdout, stderr, cwd and environment and runs the task.
+
+
+def receive_request(
+    conn: socket.socket,
+) -> tuple[dict, list[int]]:
+    """
+    Receive a length-prefixed JSON request and the file descriptors passed with it.
+
+    Args:
+        conn (socket.socket): The connection to the client.
+
+    Returns:
+        tuple[dict, list[int]]: The request and the received file descriptors.
+    """
+
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+    size = int.from_bytes(data[:4], "big")
+    payload = data[4:]
+    while len(payload) < size:
+        chunk = conn.recv(size - len(payload))
+        if not chunk:
+            break
+        payload += chunk
+
+    return json.loads(payload), fds
+
+
+def forward_interrupts(
+    conn: socket.socket,
+) -> None:
+    """
+    Raise KeyboardInterrupt in the task when the client is interrupted or goes away.
+
+    Args:
+        conn (socket.socket): The connection to the client.
+    """
+
+    while True:
+        data = conn.recv(1)
+        if not data or data == INTERRUPT:
+            os.kill(os.getpid(), signal.SIGINT)
+        if not data:
+            return
+
+
+def run_request(
+    conn: socket.socket,
+    request: dict,
+    fds: list[int],
+) -> int:
+    """
+    Run a client request in the current (forked) process.
+
+    Args:
+        conn (socket.socket): The connection to the client.
+        request (dict): The request holding argv, cwd and env.
+        fds (list[int]): The client's stdin, stdout and stderr.
+
+    Returns:
+        int: The exit code of the task.
+    """
+
+    from .main import program
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    threading.Thread(target=forward_interrupts, args=(conn,), daemon=True).start()
+
+    try:
+        program.run(request["argv"])
+    except SystemExit as error:
+        return error.code if isinstance(error.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+
+def same_user(
+    conn: socket.socket,
+) -> bool:
+    """
+    Check that a client runs as the same user as the daemon, where the platform tells.
+
+    Args:
+        conn (socket.socket): The connection of the client.
+
+    Returns:
+        bool: False if the client is known to run as another user.
+    """
+
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+
+    return uid == os.getuid()
+
+
+def join_threads() -> None:
+    """Wait for the non-daemon threads of the process, as the interpreter does before exiting."""
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+
+
+def serve() -> None:
+    """
+    Serve client requests until stopped.
+
+    The daemon shuts down when the gtasks sources change, so clients never run stale code.
+    """
+
+    from .main import load_namespace
+
+    # Import every task module (and inquirer, yaml, ...) once; children inherit them
+    load_namespace()
+    key = manifest.fingerprint()
+
+    path = socket_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The daemon runs whatever its clients send, so the socket is created private to the user
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f"gtasks daemon listening on {path}", flush=True)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            if not same_user(conn):
+                conn.close()
+                continue
+            try:
+                request, fds = receive_request(conn)
+            except (OSError, ValueError):
+                conn.close()
+                continue
+            if request["command"] == "stop":
+                conn.sendall(b"stopped\n")
+                return
+            if request["command"] == "ping":
+                conn.sendall(f"pong {os.getpid()}\n".encode())
+            elif manifest.fingerprint() != key:
+                conn.sendall(b"stale\n")
+                return
+            elif os.fork() == 0:
+                server.close()
+                code = 1
+                try:
+                    code = run_request(conn, request, fds)
+                    # The client disconnects once it has the exit code; don't interrupt ourselves
+                    signal.signal(signal.SIGINT, signal.SIG_IGN)
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    conn.sendall(f"exit {code}\n".encode())
+                    # Let the background work the task started (index sync, cache refresh) finish,
+                    # as it would when the process exits normally
+                    join_threads()
+                finally:
+                    os._exit(code)
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+def request_daemon(
+    command: str,
+) -> str | None:
+    """
+    Send a control command to the daemon.
+
+    Args:
+        command (str): The command, "ping" or "stop".
+
+    Returns:
+        str | None: The reply of the daemon, or None if it is not running.
+    """
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path())
+            send_request(sock, {"command": command})
+            return sock.makefile("r").readline().strip()
+    except OSError:
+        return None
+
+
+@task
+def start(
+    _: Context,
+) -> None:
+    """
+    Start the gtasks daemon in the background.
+
+    Once started, `gtasksc` runs tasks in a warm process instead of starting Python and importing every module.
+    """
+
+    if request_daemon("ping"):
+        print("The gtasks daemon is already running.")
+        return
+
+    log = os.path.join(manifest.cache_dir(), "daemon.log")
+    os.makedirs(os.path.dirname(log), exist_ok=True)
+    with open(
+        log,
+        "a",
+    ) as file:
+        subprocess.Popen(
+            [sys.executable, "-m", f"{__package__}.daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=file,
+            stderr=file,
+            start_new_session=True,
+        )
+    print(f"Started the gtasks daemon, logging to {log}")
+
+
+@task
+def stop(
+    _: Context,
+) -> None:
+    """Stop the gtasks daemon."""
+
+    if request_daemon("stop"):
+        print("Stopped the gtasks daemon.")
+    else:
+        print("The gtasks daemon is not running.")
+
+
+@task
+def status(
+    _: Context,
+) -> None:
+    """Show whether the gtasks daemon is running."""
+
+    reply = request_daemon("ping")
+    if reply:
+        print(f"The gtasks daemon is running (pid {reply.split()[1]}) on {socket_path()}")
+    else:
+        print("The gtasks daemon is not running.")
+
+
+namespace = Collection(
+    "daemon",
+    start,
+    stop,
+    status,
+)
+
+if __name__ == "__main__":
+    serve()
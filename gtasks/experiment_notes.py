@@ -0,0 +1,373 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+import yaml
+
+from .manifest import (
+    cache_dir,
+)
+from .storage import (
+    connect_db,
+    get_meta,
+    set_meta,
+)
+
+# This file contains the store of experiment notes. Notes are appended as
+# JSON lines to a log in the notes folder, which is committed with the code.
+# The log is marked with the union merge driver in .gitattributes, so notes
+# appended on two branches are both kept when they are merged. A SQLite
+# index of the log (with FTS5 over the text fields) lives in the gtasks cache
+# and only reads the lines appended since it was last updated, so queries
+# stay instant with thousands of notes.
+
+# The log of a notes folder
+NOTES_LOG = "experiments.jsonl"
+
+# Bumped when the schema changes; older indexes are rebuilt from the log
+SCHEMA_VERSION = 1
+
+# The fields of a note, in the order they are prompted for
+FIELDS = (
+    "author",
+    "date",
+    "hypothesis",
+    "results",
+    "conclusion",
+    "data_risk",
+    "model_risk",
+    "code_risk",
+)
+
+# The fields searched by free text
+TEXT_FIELDS = FIELDS[2:]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{name} TEXT NOT NULL DEFAULT ''" for name in FIELDS)},
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS notes_date ON notes (date);
+CREATE INDEX IF NOT EXISTS notes_author ON notes (author, date);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5 ({", ".join(TEXT_FIELDS)});
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class NoteLoader(yaml.SafeLoader):
+    """Loads the YAML notes written by older versions of `git.gacp`."""
+
+
+def construct_result(
+    loader: NoteLoader,
+    node: yaml.MappingNode,
+) -> str:
+    """Read the invoke Result older versions saved as the author, as its output."""
+    # Only the output is read, the other attributes hold tags the safe loader rejects
+    for key, value in node.value:
+        if (
+            isinstance(key, yaml.ScalarNode)
+            and key.value == "stdout"
+            and isinstance(value, yaml.ScalarNode)
+        ):
+            return str(loader.construct_scalar(value)).strip()
+
+    return ""
+
+
+NoteLoader.add_constructor(
+    "tag:yaml.org,2002:python/object:invoke.runners.Result",
+    construct_result,
+)
+
+
+def mark_union_merge(
+    folder: str,
+) -> None:
+    """
+    Mark the log of a folder with the union merge driver in the .gitattributes of the folder.
+
+    Args:
+        folder (str): The notes folder.
+    """
+
+    path = os.path.join(folder, ".gitattributes")
+    entry = f"{NOTES_LOG} merge=union"
+    try:
+        with open(
+            path,
+            "r",
+        ) as file:
+            if entry in file.read().splitlines():
+                return
+    except FileNotFoundError:
+        pass
+
+    with open(
+        path,
+        "a",
+    ) as file:
+        file.write(f"{entry}\n")
+
+
+def log_path(
+    folder: str,
+) -> str:
+    """Get the path of the notes log of a folder."""
+    return os.path.join(folder, NOTES_LOG)
+
+
+def append_note(
+    folder: str,
+    note: Dict[str, Any],
+) -> str:
+    """
+    Append a note to the log of a folder.
+
+    Args:
+        folder (str): The notes folder.
+        note (Dict[str, Any]): The note, with the fields in FIELDS.
+
+    Returns:
+        str: The path of the log.
+    """
+
+    mark_union_merge(folder)
+    path = log_path(folder)
+    line = (
+        json.dumps(
+            {name: str(note.get(name) or "") for name in FIELDS} | {"source": note.get("source")}
+        )
+        + "\n"
+    )
+    with open(
+        path,
+        "a",
+    ) as file:
+        file.write(line)
+
+    return path
+
+
+def index_path(
+    folder: str,
+) -> str:
+    """
+    Get the path of the index of a notes folder.
+
+    Args:
+        folder (str): The notes folder.
+
+    Returns:
+        str: The path of the SQLite database under the gtasks cache directory.
+    """
+
+    digest = hashlib.sha1(os.path.abspath(log_path(folder)).encode()).hexdigest()[:16]
+
+    return os.path.join(cache_dir(), "experiments", f"{digest}.db")
+
+
+def connect(
+    folder: str,
+) -> sqlite3.Connection:
+    """
+    Open the index of a notes folder, creating it if needed.
+
+    Args:
+        folder (str): The notes folder.
+
+    Returns:
+        sqlite3.Connection: The connection, with rows accessible by column name.
+    """
+
+    return connect_db(
+        index_path(folder),
+        SCHEMA,
+        SCHEMA_VERSION,
+        [
+            "notes",
+            "notes_fts",
+            "meta",
+        ],
+    )
+
+
+def update_index(
+    db: sqlite3.Connection,
+    folder: str,
+) -> int:
+    """
+    Index the notes appended to the log since the last update.
+
+    The index remembers how much of the log it read and a hash of it. When that part of the log
+    changed (e.g. lines merged in by git), the index is rebuilt from the whole log.
+
+    Args:
+        db (sqlite3.Connection): The index of the folder.
+        folder (str): The notes folder.
+
+    Returns:
+        int: The number of notes indexed.
+    """
+
+    try:
+        with open(
+            log_path(folder),
+            "rb",
+        ) as file:
+            content = file.read()
+    except FileNotFoundError:
+        content = b""
+
+    # Only complete lines are indexed, a note being appended is picked up next time
+    end = content.rfind(b"\n") + 1
+    offset = int(get_meta(db, "offset") or 0)
+    if offset > end or hashlib.sha1(content[:offset]).hexdigest() != get_meta(db, "digest"):
+        db.execute("DELETE FROM notes")
+        db.execute("DELETE FROM notes_fts")
+        offset = 0
+    if offset == end and offset:
+        return 0
+
+    notes = []
+    for line in content[offset:end].decode().splitlines():
+        if line.strip():
+            notes.append(json.loads(line))
+
+    with db:
+        for note in notes:
+            cursor = db.execute(
+                f"INSERT INTO notes ({', '.join(FIELDS)}, source) VALUES ({', '.join('?' * (len(FIELDS) + 1))})",
+                [str(note.get(name) or "") for name in FIELDS] + [note.get("source")],
+            )
+            db.execute(
+                f"INSERT INTO notes_fts (rowid, {', '.join(TEXT_FIELDS)}) VALUES (?, {', '.join('?' * len(TEXT_FIELDS))})",
+                [cursor.lastrowid] + [str(note.get(name) or "") for name in TEXT_FIELDS],
+            )
+        set_meta(db, "offset", str(end))
+        set_meta(db, "digest", hashlib.sha1(content[:end]).hexdigest())
+
+    return len(notes)
+
+
+def query_notes(
+    folder: str,
+    author: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    text: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Select the notes of a folder by author, date and words, updating the index first.
+
+    Args:
+        folder (str): The notes folder.
+        author (str, optional): The author of the notes.
+        since (str, optional): The first date, e.g. "2024-05" or "2024-05-02".
+        until (str, optional): The last date, included, in the same format.
+        text (str, optional): Words the hypothesis, results, conclusion or risks must all contain.
+        limit (int, optional): The maximum number of notes. Defaults to all of them.
+
+    Returns:
+        List[Dict[str, Any]]: The matching notes, newest first.
+    """
+
+    conditions = []
+    params: List[Any] = []
+    if author:
+        conditions.append("notes.author = ?")
+        params.append(author)
+    if since:
+        conditions.append("notes.date >= ?")
+        params.append(since)
+    if until:
+        conditions.append("substr(notes.date, 1, length(?)) <= ?")
+        params += [until, until]
+    if text:
+        words = re.findall(r"\w+", text)
+        if words:
+            conditions.append("notes.id IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)")
+            params.append(" AND ".join(f'"{word}"' for word in words))
+
+    query = f"SELECT {', '.join(FIELDS)}, source FROM notes"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY notes.date DESC, notes.id DESC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    db = connect(folder)
+    try:
+        update_index(db, folder)
+        rows = db.execute(query, params).fetchall()
+    finally:
+        db.close()
+
+    return [dict(row) for row in rows]
+
+
+def import_yaml_notes(
+    folder: str,
+) -> int:
+    """
+    Append the notes saved as YAML files in a folder to its log.
+
+    Each file is recorded as the `source` of its note, so files imported by a previous run are skipped.
+    The YAML files are left in place. Files that are not notes are reported and skipped.
+
+    Args:
+        folder (str): The notes folder.
+
+    Returns:
+        int: The number of notes imported.
+    """
+
+    db = connect(folder)
+    try:
+        update_index(db, folder)
+        imported = {
+            row["source"] for row in db.execute("SELECT source FROM notes WHERE source IS NOT NULL")
+        }
+    finally:
+        db.close()
+
+    notes = []
+    for path in sorted(
+        glob.glob(os.path.join(folder, "*.yaml")) + glob.glob(os.path.join(folder, "*.yml"))
+    ):
+        source = os.path.basename(path)
+        if source in imported:
+            continue
+        try:
+            with open(
+                path,
+                "r",
+            ) as file:
+                note = yaml.load(file, Loader=NoteLoader)
+        except (OSError, yaml.YAMLError) as error:
+            print(f"Skipping {path}: {error}")
+            continue
+        if not isinstance(note, dict):
+            print(f"Skipping {path}: not an experiment note")
+            continue
+        notes.append(note | {"source": source})
+
+    for note in sorted(notes, key=lambda note: str(note.get("date") or "")):
+        append_note(folder, note)
+
+    return len(notes)
@@ -0,0 +1,103 @@
+from invoke import (
+    Collection,
+)
+from invoke.context import (
+    Context,
+)
+from invoke.tasks import (
+    task,
+)
+
+from .experiment_notes import (
+    import_yaml_notes,
+    log_path,
+    query_notes,
+)
+
+# This file contains scripts related to the experiment notes written by `git.gacp`.
+
+FOLDER_HELP = "The notes folder. Defaults to notes."
+
+
+@task(
+    help={
+        "author": "Only the notes of this author",
+        "since": "Only the notes from this date on, e.g. 2024-05 or 2024-05-02",
+        "until": "Only the notes up to this date, included",
+        "text": "Words the hypothesis, results, conclusion or risks must contain",
+        "limit": "The maximum number of notes. Defaults to 20.",
+        "folder": FOLDER_HELP,
+    }
+)
+def query(
+    ctx: Context,
+    author: str = None,
+    since: str = None,
+    until: str = None,
+    text: str = None,
+    limit: int = 20,
+    folder: str = "notes",
+) -> None:
+    """
+    Query the experiment notes.
+
+    This function selects the notes of the notes folder by author, date range and words, and prints them newest first. The notes are read from a local index of the notes log, which only reads the notes added since the last query.
+
+    Args:
+        author (str, optional): Only the notes of this author.
+        since (str, optional): Only the notes from this date on.
+        until (str, optional): Only the notes up to this date, included.
+        text (str, optional): Words the hypothesis, results, conclusion or risks must contain.
+        limit (int, optional): The maximum number of notes. Defaults to 20.
+        folder (str, optional): The notes folder. Defaults to notes.
+
+    Returns:
+        None
+    """
+
+    notes = query_notes(folder, author, since, until, text, limit)
+    if not notes:
+        print("No experiment notes found")
+    for note in notes:
+        print(f"{note['date']} - {note['author']}")
+        for name in (
+            "hypothesis",
+            "results",
+            "conclusion",
+            "data_risk",
+            "model_risk",
+            "code_risk",
+        ):
+            if note[name]:
+                print(f"    {name.replace('_', ' ')}: {note[name]}")
+
+
+@task(
+    name="import",
+    help={"folder": FOLDER_HELP},
+)
+def import_notes(
+    ctx: Context,
+    folder: str = "notes",
+) -> None:
+    """
+    Import the experiment notes saved as YAML files.
+
+    Older versions of `git.gacp` saved each note in its own YAML file. This function appends them to the notes log of the folder, oldest first, so they can be queried with `exp.query`. Files imported before are skipped, and the YAML files are left in place to be removed once the log is committed.
+
+    Args:
+        folder (str, optional): The notes folder. Defaults to notes.
+
+    Returns:
+        None
+    """
+
+    imported = import_yaml_notes(folder)
+    print(f"{imported} notes imported into {log_path(folder)}")
+
+
+namespace = Collection(
+    "exp",
+    import_notes,
+    query,
+)
@@ -1,14 +1,28 @@
 import datetime
+import json
 import os
+import shlex
+import tempfile
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from dataclasses import (
+    dataclass,
+)
 from typing import (
     Any,
+    Dict,
+    List,
+    Optional,
     Union,
 )
 
 import inquirer
-import yaml
 from invoke import (
     Collection,
+    Exit,
+    Result,
     run,
 )
 from invoke.context import (
@@ -18,66 +32,145 @@ from invoke.tasks import (
     task,
 )
 
+from ._getowner import get_owner_repo
 from .base import (
     COMMIT_TYPES,
     get_assignee,
-    
+    parse_collaborators,
+    select_paths,
 )
-
-from ._getowner import get_owner_repo
 from .branch import (
     git_current_branch,
 )
+from .experiment_notes import (
+    append_note,
+)
+from .github import (
+    MAX_WORKERS,
+    api,
+)
+from .gitmeta import (
+    read_submodule_paths,
+)
+from .manifest import (
+    cache_dir,
+)
+from .prefetch import (
+    prefetch,
+    result,
+)
+from .repo_context import (
+    get_repo_context,
+)
 
 # This file contains scripts related to git activities.
 
 
+@dataclass
+class Change:
+    """A changed path in `git status`."""
+
+    path: str
+    status: str
+    orig_path: Optional[str] = None
+
+
+def git_status() -> List[Change]:
+    """
+    Get the changed paths with `git status --porcelain=v2 -z`.
+
+    Paths are NUL separated, so renames, spaces and non-ASCII names are read exactly.
+
+    Returns:
+        List[Change]: The changed, renamed, unmerged and untracked paths.
+    """
+
+    output = run(
+        "git status --porcelain=v2 -z --untracked-files=all",
+        hide=True,
+        in_stream=False,
+    ).stdout
+    fields = iter(output.split("\0"))
+    changes = []
+    for entry in fields:
+        kind = entry[:1]
+        if kind == "1":
+            parts = entry.split(" ", 8)
+            changes.append(Change(parts[8], parts[1]))
+        elif kind == "2":
+            parts = entry.split(" ", 9)
+            changes.append(Change(parts[9], parts[1], next(fields)))
+        elif kind == "u":
+            parts = entry.split(" ", 10)
+            changes.append(Change(parts[10], parts[1]))
+        elif kind == "?":
+            changes.append(Change(entry[2:], "??"))
+
+    return changes
+
+
+def stage_paths(
+    paths: List[str],
+) -> None:
+    """
+    Stage paths with one `git add`, passing them in a file so the command line stays short.
+
+    The file is used rather than stdin because invoke feeds stdin to the command one byte at a time.
+
+    Args:
+        paths (List[str]): The paths to stage.
+    """
+
+    with tempfile.NamedTemporaryFile(
+        "w",
+        suffix=".pathspec",
+    ) as file:
+        file.write("\0".join(paths))
+        file.flush()
+        run(
+            f"git --literal-pathspecs add --pathspec-from-file={shlex.quote(file.name)} --pathspec-file-nul",
+            in_stream=False,
+        )
+
+
 def git_add() -> None:
     """
     Interactively add changed files to the git staging area.
     This function checks the current git status for any changed files.
     If there are no changed files, it prints a message and exits.
     If there are changed files, it prompts the user to select which files
-    to add to the staging area using an interactive checkbox menu.
+    to add to the staging area, grouped by directory when there are many.
     If no files are selected, it prints a message and exits.
     Otherwise, it adds the selected files to the git staging area and
     prints a confirmation message.
     """
-    submodules = get_submodules()
-    result = run("git status --porcelain")
+    trie = build_submodule_trie(get_submodules())
+    changes = git_status()
 
-    changed_files = [line[3:] for line in result.stdout.splitlines() if line]
-    submodule_files = [
-        file
+    changed_files = [change.path for change in changes]
+    changed_submodules = {
+        submodule
         for file in changed_files
-        if any(file.startswith(submodule) for submodule in submodules)
-    ]
+        if (submodule := find_submodule(trie, file))
+    }
 
-    if submodule_files:
-        for file in submodule_files:
-            add_commit_submodule(file)
+    if changed_submodules:
+        commit_submodules(sorted(changed_submodules))
 
     if not changed_files:
         print("No files to add.")
         return
 
-    files_to_add = inquirer.prompt(
-        [
-            inquirer.Checkbox(
-                "files",
-                message="Select the files to add to the commit",
-                choices=changed_files,
-            )
-        ]
-    )["files"]
+    files_to_add = select_paths(
+        "Select the files to add to the commit",
+        changed_files,
+    )
 
     if not files_to_add:
         print("No files selected.")
         return
 
-    files_to_add = " ".join(files_to_add)
-
-    run(f"git add {files_to_add}")
+    stage_paths(files_to_add)
 
     print("Files added to the commit.")
 
@@ -200,6 +293,78 @@ def create_PR_body() -> str:
     return body
 
 
+def prompt_pr(
+    owner: str,
+    repo: str,
+) -> Dict[str, str]:
+    """
+    Prompt the user for the title, body and assignee of a pull request.
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The name of the repository.
+    Returns:
+        Dict[str, str]: The `title`, `body` and `assignee` of the PR.
+    """
+
+    title = inquirer.text("Enter the PR title")
+    body = create_PR_body()
+    assignee = get_assignee(
+        owner,
+        repo,
+    )
+
+    return {
+        "title": title,
+        "body": body,
+        "assignee": assignee,
+    }
+
+
+def open_pr(
+    owner: str,
+    repo: str,
+    pr: Dict[str, str],
+    head: str,
+) -> None:
+    """
+    Open a pull request on GitHub from a pushed branch.
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The name of the repository.
+        pr (Dict[str, str]): The `title`, `body` and `assignee` of the PR, as given by `prompt_pr`.
+        head (str): The branch to merge.
+    Returns:
+        None
+    """
+
+    base = result(
+        get_repo_context,
+        owner,
+        repo,
+    ).default_branch
+
+    response = api(
+        "POST",
+        f"repos/{owner}/{repo}/pulls",
+        {
+            "title": pr["title"],
+            "body": pr["body"],
+            "head": head,
+            "base": base,
+        },
+    )
+    if response.status != 201:
+        raise Exit(f"Could not create the PR: {response.status} {response.body}")
+    pull = response.json()
+
+    api(
+        "POST",
+        f"repos/{owner}/{repo}/issues/{pull['number']}/assignees",
+        {"assignees": [pr["assignee"]]},
+    )
+    print(pull["html_url"])
+
+
 def create_pr(
     owner: str,
     repo: str,
@@ -213,35 +378,312 @@ def create_pr(
         None
     """
 
-    title = inquirer.text("Enter the PR title")
-    body = create_PR_body()
-    assignee = get_assignee(
+    open_pr(
         owner,
         repo,
+        prompt_pr(
+            owner,
+            repo,
+        ),
+        git_current_branch(),
     )
 
-    run(f'gh pr create --base=main --title="{title}" --body="{body}" --assignee="{assignee}"')
+
+def pr_draft_path(
+    owner: str,
+    repo: str,
+    branch: str,
+) -> str:
+    """Get the path of the saved PR draft of a branch."""
+    return os.path.join(cache_dir(), "repos", owner, repo, "pr-drafts", f"{branch.replace('/', '-')}.json")
+
+
+def store_pr_draft(
+    owner: str,
+    repo: str,
+    branch: str,
+    pr: Dict[str, str],
+) -> str:
+    """
+    Save a PR whose branch could not be pushed, so `git.pr` can open it later.
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The name of the repository.
+        branch (str): The branch of the PR.
+        pr (Dict[str, str]): The `title`, `body` and `assignee` of the PR.
+    Returns:
+        str: The path of the draft.
+    """
+
+    path = pr_draft_path(owner, repo, branch)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(
+        path,
+        "w",
+    ) as file:
+        json.dump(pr, file)
+
+    return path
+
+
+def load_pr_draft(
+    owner: str,
+    repo: str,
+    branch: str,
+) -> Optional[Dict[str, str]]:
+    """Load the saved PR draft of a branch, None if there is none."""
+    try:
+        with open(
+            pr_draft_path(owner, repo, branch),
+            "r",
+        ) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def push_branch(
+    branch: str,
+    progress: Optional[str] = None,
+) -> Result:
+    """
+    Push a branch and set its upstream, without reading the terminal.
+
+    Credential and SSH passphrase prompts are disabled so the push can run in the background
+    while the user answers other prompts. The SSH command configured with `GIT_SSH_COMMAND` or
+    `core.sshCommand` is kept, with batch mode added. A push needing a prompt fails and is retried
+    by `wait_for_push`.
+
+    Args:
+        branch (str): The branch to push.
+        progress (str, optional): A file receiving the progress of the push as it runs, read by `wait_for_push`.
+
+    Returns:
+        Result: The result of `git push`, failed or not.
+    """
+
+    env = {"GIT_TERMINAL_PROMPT": "0"}
+    # GIT_SSH names a program rather than a command, so options cannot be added to it
+    if not os.environ.get("GIT_SSH"):
+        ssh = os.environ.get("GIT_SSH_COMMAND") or run(
+            "git config --get core.sshCommand",
+            hide=True,
+            warn=True,
+            in_stream=False,
+        ).stdout.strip()
+        env["GIT_SSH_COMMAND"] = f"{ssh or 'ssh'} -o BatchMode=yes"
+
+    if progress is None:
+        return run(
+            f"git push --progress --set-upstream origin {shlex.quote(branch)}",
+            hide=True,
+            warn=True,
+            in_stream=False,
+            env=env,
+        )
+
+    with open(
+        progress,
+        "w",
+    ) as file:
+        return run(
+            f"git push --progress --set-upstream origin {shlex.quote(branch)}",
+            hide="out",
+            warn=True,
+            in_stream=False,
+            err_stream=file,
+            env=env,
+        )
+
+
+def progress_lines(
+    output: str,
+) -> List[str]:
+    """
+    Get the lines git progress output leaves on a terminal, where carriage returns rewrite the current line.
+
+    Args:
+        output (str): The output of git, e.g. of `git push --progress`.
+
+    Returns:
+        List[str]: The lines, as last written.
+    """
+
+    lines = []
+    for line in output.split("\n"):
+        parts = [part for part in line.split("\r") if part.strip()]
+        if parts:
+            lines.append(parts[-1].rstrip())
+
+    return lines
+
+
+def wait_for_push(
+    push: Future,
+    branch: str,
+    progress: Optional[str] = None,
+) -> bool:
+    """
+    Wait for a background push, showing its progress, and retry it in the foreground if it failed.
+    Args:
+        push (Future): The future of `push_branch`.
+        branch (str): The pushed branch.
+        progress (str, optional): The progress file given to `push_branch`, removed once the push is done.
+    Returns:
+        bool: Whether the branch was pushed.
+    """
+
+    if not push.done():
+        print(f"Waiting for the push of {branch}...")
+        status = ""
+        while not push.done():
+            try:
+                push.result(timeout=0.2)
+            except TimeoutError:
+                pass
+            try:
+                with open(
+                    progress or os.devnull,
+                    "r",
+                ) as file:
+                    lines = progress_lines(file.read())
+            except OSError:
+                lines = []
+            if lines and lines[-1] != status:
+                print(f"\r\033[K{lines[-1]}", end="", flush=True)
+                status = lines[-1]
+        if status:
+            print("\r\033[K", end="", flush=True)
+    if progress is not None:
+        try:
+            os.remove(progress)
+        except OSError:
+            pass
+
+    pushed = push.result()
+    if pushed.ok:
+        print("\n".join(progress_lines(pushed.stderr)))
+        return True
+
+    print(f"Could not push {branch}:\n" + "\n".join(progress_lines(pushed.stderr)))
+    print(f"Retrying the push of {branch}")
+
+    return run(
+        f"git push --set-upstream origin {shlex.quote(branch)}",
+        warn=True,
+    ).ok
+
+
+def build_submodule_trie(
+    submodules: List[str],
+) -> Dict[str, Any]:
+    """
+    Build a trie of submodule paths, keyed by path component.
+
+    Args:
+        submodules (List[str]): The paths of the submodules.
+
+    Returns:
+        Dict[str, Any]: The trie. A node holding a submodule has its path under the "" key.
+    """
+
+    trie: Dict[str, Any] = {}
+    for submodule in submodules:
+        node = trie
+        for part in submodule.strip("/").split("/"):
+            node = node.setdefault(part, {})
+        node[""] = submodule
+
+    return trie
+
+
+def find_submodule(
+    trie: Dict[str, Any],
+    path: str,
+) -> Optional[str]:
+    """
+    Find the submodule containing a path, in time proportional to the depth of the path.
+
+    Args:
+        trie (Dict[str, Any]): The trie of submodule paths.
+        path (str): The path, relative to the repository root.
+
+    Returns:
+        Optional[str]: The innermost submodule containing the path, or None if it is not in a submodule.
+    """
+
+    node = trie
+    found = None
+    for part in path.strip("/").split("/"):
+        if part not in node:
+            break
+        node = node[part]
+        found = node.get("", found)
+
+    return found
 
 
 def add_commit_submodule(
-    path,
-):
-    if os.path.exists(f"{path}"):
-        os.chdir(f"{path}")
-        if os.path.exists(".git"):
-            run("git add .")
-            run(f'git commit -m "Add {path} results"')
-            os.chdir("..")
-            print(f"{path} is added to the submodule")
-        else:
-            print(f"{path} is pushed to the main repository")
-    else:
-        print(f"{path} does not exist")
+    path: str,
+) -> str:
+    """
+    Commit and push every change of a submodule.
+
+    The commands run with `git -C`, so several submodules can be committed concurrently.
+
+    Args:
+        path (str): The path of the submodule.
+
+    Returns:
+        str: What happened to the submodule.
+    """
+
+    if not os.path.exists(path):
+        return f"{path} does not exist"
+    if not os.path.exists(os.path.join(path, ".git")):
+        return f"{path} is pushed to the main repository"
+
+    run(f"git -C '{path}' add -A", hide=True, in_stream=False)
+    commit = run(
+        f"git -C '{path}' commit -m \"Add {path} results\"",
+        hide=True,
+        warn=True,
+        in_stream=False,
+    )
+    if commit.failed:
+        if "nothing to commit" in commit.stdout:
+            return f"{path} has nothing to commit"
+        return f"{path} could not be committed: {commit.stderr.strip() or commit.stdout.strip()}"
+    push = run(
+        f"git -C '{path}' push",
+        hide=True,
+        warn=True,
+        in_stream=False,
+    )
+    if push.failed:
+        return f"{path} is committed but could not be pushed: {push.stderr.strip()}"
+
+    return f"{path} is added to the submodule"
+
+
+def commit_submodules(
+    submodules: List[str],
+) -> None:
+    """
+    Commit and push the changes of submodules concurrently, one commit per submodule.
+
+    Args:
+        submodules (List[str]): The paths of the submodules.
+    """
+
+    with ThreadPoolExecutor(max_workers=min(len(submodules), MAX_WORKERS)) as pool:
+        for message in pool.map(add_commit_submodule, submodules):
+            print(message)
 
 
 def add_experiment_notes():
     """
-    Prompts the user for details about an experiment and saves the notes to a YAML file.
+    Prompts the user for details about an experiment and appends the notes to the notes log.
     The function collects the following information from the user:
     - Hypothesis
     - Results
@@ -249,8 +691,8 @@ def add_experiment_notes():
     - Risks related to data (optional)
     - Risks related to the model (optional)
     - Risks related to the code (optional)
-    The notes are saved in a YAML file named with the current date and time.
-    The function also commits and pushes the changes to the git submodules.
+    The notes are dated with the current date and time, and appended to `experiments.jsonl` in the
+    selected folder.
     Returns:
         None
     """
@@ -273,7 +715,11 @@ def add_experiment_notes():
         default="",
     )
 
-    author = run("gh api user -q .login")
+    try:
+        author = result(get_repo_context, *get_owner_repo()).viewer
+    except RuntimeError as error:
+        author = run("git config user.name", hide=True, warn=True, in_stream=False).stdout.strip()
+        print(f"{error}, using the git user name '{author}' as the author of the notes")
 
     experiment_notes = {
         "author": author,
@@ -299,25 +745,25 @@ def add_experiment_notes():
         ]
     )["folder"]
 
-    # Save the experiment notes to a YAML file
-    with open(
-        f"{notes_folder}/{date_time}.yaml",
-        "w",
-    ) as file:
-        yaml.dump(
-            experiment_notes,
-            file,
-        )
+    # Append the experiment notes to the notes log, queried with `exp.query`
+    append_note(
+        notes_folder,
+        experiment_notes,
+    )
 
 
 def get_submodules():
     """
     Get the submodules in the repository.
-    This function uses the `git` command to retrieve the submodules in the repository.
+    The .gitmodules file is read directly, and the `git` command is only used when it cannot be parsed.
     Returns:
         List[str]: A list containing the submodules in the repository.
     """
 
+    submodules = read_submodule_paths()
+    if submodules is not None:
+        return submodules
+
     try:
         result = run(
             "git config --file .gitmodules --get-regexp path",
@@ -345,8 +791,9 @@ def gacp(
         3. Stages all changes for commit.
         4. Prompts the user for the type of commit.
         5. Commits the changes with the specified commit type.
-        6. Pushes the changes to the remote repository and sets the upstream branch.
-        7. If the commit type is not "WIP", "exp", or "backup", prompts the user to create a pull request.
+        6. Pushes the changes to the remote repository and sets the upstream branch, in the background.
+        7. If the commit type is not "WIP", "exp", or "backup", prompts the user to create a pull request
+           while the push runs, and creates it once the push is done.
     """
 
     (
@@ -355,17 +802,25 @@ def gacp(
     ) = get_owner_repo()
     current_branch = git_current_branch()
 
+    # Fetch what the notes and PR prompts need while files are staged and the commit is written
+    prefetch(get_repo_context, owner, repo)
+    prefetch(parse_collaborators, owner, repo)
+
     git_add()
 
     commit_type = get_commit_type()
 
     git_commit(commit_type)
 
-    try:
-        run(f"git push --set-upstream origin {current_branch}")
-    except Exception:
-        run("git push --all")
+    # Push while the PR prompts are answered, recording its progress to show if the push is waited for
+    (
+        descriptor,
+        progress,
+    ) = tempfile.mkstemp(suffix=".push")
+    os.close(descriptor)
+    push = prefetch(push_branch, current_branch, progress)
 
+    pull = None
     if commit_type not in [
         "WIP",
         "exp",
@@ -375,13 +830,77 @@ def gacp(
             "Create a PR?",
             default=True,
         ):
-            create_pr(
+            pull = prompt_pr(
+                owner,
+                repo,
+            )
+
+    pushed = wait_for_push(push, current_branch, progress)
+    if pull is None:
+        if not pushed:
+            raise Exit(f"Could not push {current_branch}")
+    elif not pushed:
+        path = store_pr_draft(owner, repo, current_branch, pull)
+        raise Exit(f"Could not push {current_branch}. The PR was saved to {path}, run `gtasks git.pr` once the branch is pushed.")
+    else:
+        try:
+            open_pr(
                 owner,
                 repo,
+                pull,
+                current_branch,
             )
+        except (Exit, RuntimeError) as error:
+            path = store_pr_draft(owner, repo, current_branch, pull)
+            raise Exit(f"{error}\nThe PR was saved to {path}, run `gtasks git.pr` to try again.")
+
+
+@task
+def pr(
+    ctx: Context,
+) -> None:
+    """
+    Create a pull request for the current branch.
+    The PR saved by `git.gacp` when the branch could not be pushed is used if there is one,
+    otherwise the title, body and assignee are prompted for.
+    Args:
+        ctx (Context): Context parameter used to run commands.
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    current_branch = git_current_branch()
+    prefetch(get_repo_context, owner, repo)
+
+    draft = load_pr_draft(owner, repo, current_branch)
+    if draft is not None and inquirer.confirm(
+        f"Use the saved PR '{draft['title']}'?",
+        default=True,
+    ):
+        pull = draft
+    else:
+        prefetch(parse_collaborators, owner, repo)
+        pull = prompt_pr(
+            owner,
+            repo,
+        )
+
+    open_pr(
+        owner,
+        repo,
+        pull,
+        current_branch,
+    )
+    try:
+        os.remove(pr_draft_path(owner, repo, current_branch))
+    except OSError:
+        pass
 
 
 namespace = Collection(
     "git",
     gacp,
+    pr,
 )
@@ -0,0 +1,472 @@
+import http.client
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import urllib.parse
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from . import (
+    profiler,
+)
+from .scheduler import (
+    scheduler,
+)
+
+# This file contains the in-process GitHub client. It reuses the `gh` auth
+# token and keeps a pool of keep-alive HTTPS connections, so a request costs
+# a round trip instead of a `gh` process start and a TLS handshake. When no
+# token can be found, requests fall back to `gh api`.
+
+API_URL_ENV_VAR = "GTASKS_GITHUB_API"
+DEFAULT_API_URL = "https://api.github.com"
+POOL_SIZE = 8
+TIMEOUT = 30
+
+# Requests that may create something each time they are sent, e.g. an issue or a PR
+NON_IDEMPOTENT_METHODS = {"POST"}
+
+# Lists are fetched page by page, with the pages after the first fetched concurrently
+PER_PAGE = 100
+MAX_WORKERS = 8
+LAST_PAGE = re.compile(r'[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+@dataclass
+class Response:
+    """A response of the GitHub API."""
+
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: str = ""
+
+    def json(self) -> Any:
+        """Decode the JSON body, None if it is empty."""
+        return json.loads(self.body) if self.body.strip() else None
+
+
+def parse_response(
+    output: str,
+) -> Response:
+    """
+    Parse the output of `gh api --include`.
+
+    Args:
+        output (str): The output of the command.
+
+    Returns:
+        Response: The status code, the headers (lower-cased names) and the body.
+    """
+
+    head, _, body = output.replace("\r\n", "\n").partition("\n\n")
+    lines = head.splitlines()
+    status = int(lines[0].split()[1]) if lines and lines[0].startswith("HTTP") else 0
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    return Response(status, headers, body)
+
+
+def get_token() -> Optional[str]:
+    """
+    Get the GitHub token used by `gh`.
+
+    Returns:
+        Optional[str]: `GH_TOKEN`, `GITHUB_TOKEN` or the token of `gh auth token`, None if there is none.
+    """
+
+    token = os.environ.get("GH_TOKEN") or os.environ.get("GITHUB_TOKEN")
+    if token:
+        return token
+    try:
+        result = subprocess.run(
+            ["gh", "auth", "token"],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+class GitHubClient:
+    """GitHub REST and GraphQL client with a pool of keep-alive connections."""
+
+    def __init__(
+        self,
+        token: str,
+        api_url: str = DEFAULT_API_URL,
+    ) -> None:
+        url = urllib.parse.urlsplit(api_url)
+        self.token = token
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip("/")
+        self.pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_SIZE)
+
+    def connect(self) -> http.client.HTTPConnection:
+        """Open a new connection to the API."""
+        if self.scheme == "http":
+            return http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+        return http.client.HTTPSConnection(self.host, self.port, timeout=TIMEOUT)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """
+        Send a request on a pooled connection.
+
+        A request on a reused connection that the server already closed is retried once on a new one.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The API path, e.g. "repos/owner/repo/labels".
+            body (Any, optional): The JSON body.
+            headers (Dict[str, str], optional): Extra headers, e.g. If-None-Match.
+
+        Returns:
+            Response: The response.
+        """
+
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"token {self.token}",
+            "User-Agent": "gtasks",
+            **(headers or {}),
+        }
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            try:
+                conn = self.pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self.connect()
+                reused = False
+            try:
+                conn.request(method, f"{self.prefix}/{path.lstrip('/')}", payload, headers)
+                response = conn.getresponse()
+                data = response.read().decode()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+            return Response(
+                response.status,
+                {key.lower(): value for key, value in response.getheaders()},
+                data,
+            )
+
+
+def request_gh(
+    method: str,
+    path: str,
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Send a request with `gh api`, for when no token is available.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The API path.
+        body (Any, optional): The JSON body.
+        headers (Dict[str, str], optional): Extra headers.
+
+    Returns:
+        Response: The response.
+    """
+
+    command = ["gh", "api", "--include", "-X", method, path]
+    for key, value in (headers or {}).items():
+        command += ["-H", f"{key}: {value}"]
+    if body is not None:
+        command += ["--input", "-"]
+    try:
+        result = subprocess.run(
+            command,
+            input=None if body is None else json.dumps(body),
+            capture_output=True,
+            text=True,
+        )
+    except OSError as error:
+        return Response(0, {}, str(error))
+
+    return parse_response(result.stdout)
+
+
+_client: Dict[str, Optional[GitHubClient]] = {}
+_lock = threading.Lock()
+
+
+def get_client() -> Optional[GitHubClient]:
+    """
+    Get the shared GitHub client.
+
+    Returns:
+        Optional[GitHubClient]: The client, or None if no token is available.
+    """
+
+    with _lock:
+        if "client" not in _client:
+            token = get_token()
+            api_url = os.environ.get(API_URL_ENV_VAR, DEFAULT_API_URL)
+            _client["client"] = GitHubClient(token, api_url) if token else None
+
+    return _client["client"]
+
+
+def api(
+    method: str,
+    path: str,
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    idempotent: Optional[bool] = None,
+) -> Response:
+    """
+    Send a request to the GitHub API, through the shared client or `gh api`.
+
+    Every request goes through the shared scheduler, which bounds the requests in flight and
+    retries throttled ones, and failed ones when they are idempotent.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The API path, e.g. "repos/owner/repo/labels".
+        body (Any, optional): The JSON body.
+        headers (Dict[str, str], optional): Extra headers, e.g. If-None-Match.
+        idempotent (bool, optional): Whether the request can be sent twice. Defaults to True for every method but POST.
+
+    Returns:
+        Response: The response.
+    """
+
+    client = get_client()
+
+    def send() -> Response:
+        if client is None:
+            return request_gh(method, path, body, headers)
+        try:
+            return client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException) as error:
+            return Response(0, {}, str(error))
+
+    with profiler.record("api", f"{method} {path}") as event:
+        response = scheduler.submit(
+            send,
+            method not in NON_IDEMPOTENT_METHODS if idempotent is None else idempotent,
+        )
+        event["status"] = response.status
+
+    return response
+
+
+def graphql_strict(
+    query: str,
+    **variables: Any,
+) -> Dict[str, Any]:
+    """
+    Run a GraphQL query, failing unless it fully succeeded.
+
+    Args:
+        query (str): The query.
+        **variables: The variables of the query.
+
+    Returns:
+        Dict[str, Any]: The `data` of the response.
+
+    Raises:
+        RuntimeError: If the request failed or the response has errors or no data.
+    """
+
+    response = api(
+        "POST",
+        "graphql",
+        {"query": query, "variables": variables},
+        idempotent=not query.lstrip().startswith("mutation"),
+    )
+    try:
+        result = response.json() if response.status == 200 else None
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        raise RuntimeError(
+            f"GraphQL request failed: {response.status} {response.body.strip()[:200]}"
+        )
+    if result.get("errors"):
+        messages = "; ".join(str(error.get("message", error)) for error in result["errors"])
+        raise RuntimeError(f"GraphQL request failed: {messages}")
+    if not result.get("data"):
+        raise RuntimeError("GraphQL request returned no data")
+
+    return result["data"]
+
+
+def graphql(
+    query: str,
+    **variables: Any,
+) -> Dict[str, Any]:
+    """
+    Run a GraphQL query.
+
+    Args:
+        query (str): The query.
+        **variables: The variables of the query.
+
+    Returns:
+        Dict[str, Any]: The `data` of the response, possibly partial if some fields failed, empty if the request failed.
+    """
+
+    response = api(
+        "POST",
+        "graphql",
+        {"query": query, "variables": variables},
+        idempotent=not query.lstrip().startswith("mutation"),
+    )
+    try:
+        return (response.json() or {}).get("data") or {}
+    except ValueError:
+        return {}
+
+
+def fetch_page(
+    endpoint: str,
+    page: int,
+    etag: Optional[str] = None,
+) -> tuple:
+    """
+    Fetch one page of a list endpoint, conditionally on its ETag.
+
+    Args:
+        endpoint (str): The REST endpoint, e.g. "repos/owner/repo/labels", optionally with a query string.
+        page (int): The page number, starting at 1.
+        etag (str, optional): The ETag of the cached page, if any.
+
+    Returns:
+        tuple: The status code, the ETag, the items (None unless the status is 200) and the last page number.
+    """
+
+    response = api(
+        "GET",
+        f"{endpoint}{'&' if '?' in endpoint else '?'}per_page={PER_PAGE}&page={page}",
+        headers={"If-None-Match": etag} if etag else None,
+    )
+    last = LAST_PAGE.search(response.headers.get("link", ""))
+
+    return (
+        response.status,
+        response.headers.get("etag"),
+        response.json() if response.status == 200 else None,
+        int(last.group(1)) if last else page,
+    )
+
+
+def iter_pages(
+    endpoint: str,
+) -> Iterator[list]:
+    """
+    Fetch the pages of a list endpoint one after the other, yielding each as it arrives.
+
+    Args:
+        endpoint (str): The REST endpoint, optionally with a query string.
+
+    Yields:
+        list: The items of each page.
+
+    Raises:
+        RuntimeError: If a request fails.
+    """
+
+    page = 1
+    while True:
+        status, _, items, last = fetch_page(endpoint, page)
+        if status != 200:
+            raise RuntimeError(f"Could not fetch {endpoint}: {status}")
+        yield items
+        if page >= last or not items:
+            return
+        page += 1
+
+
+def fetch_pages(
+    endpoint: str,
+    transform: Callable[[list], list],
+    cached: List[Dict[str, Any]],
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch every page of a list endpoint.
+
+    The first page tells how many pages there are; the others are then fetched concurrently.
+    Pages that did not change (304) are taken from the cache.
+
+    Args:
+        endpoint (str): The REST endpoint, e.g. "repos/owner/repo/labels".
+        transform (Callable[[list], list]): Keeps what the cache needs from the items of a page.
+        cached (List[Dict[str, Any]]): The cached pages, each with its `etag` and `data`.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The pages, or None if a request failed.
+    """
+
+    def get(page: int) -> Optional[Dict[str, Any]]:
+        old = cached[page - 1] if page <= len(cached) else None
+        status, etag, items, last = fetch_page(endpoint, page, old and old["etag"])
+        if status == 304 and old:
+            return {**old, "last": last}
+        if status == 200:
+            return {"etag": etag, "data": transform(items), "last": last}
+        return None
+
+    first = get(1)
+    if first is None:
+        return None
+    # A 304 may come without the Link header, so also trust the number of cached pages
+    last = max(first.pop("last"), len(cached))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        pages = [first, *pool.map(get, range(2, last + 1))]
+    if None in pages:
+        return None
+
+    # Items added since the cache was filled may have opened a new page
+    while len(pages[-1]["data"]) == PER_PAGE:
+        page = get(len(pages) + 1)
+        if page is None or not page["data"]:
+            break
+        pages.append(page)
+
+    for page in pages:
+        page.pop("last", None)
+
+    return pages
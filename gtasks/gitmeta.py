@@ -0,0 +1,173 @@
+import configparser
+import os
+from dataclasses import (
+    dataclass,
+)
+from typing import (
+    List,
+    Optional,
+)
+
+# This file contains the reading of git metadata (HEAD, config, .gitmodules)
+# straight from the files in the .git directory, so the common questions
+# asked on every run do not spawn git. Functions return None for layouts they
+# do not handle (GIT_DIR and friends, reftable refs, detached HEAD, ...),
+# and callers fall back to running git.
+
+# Environment variables that change where git looks for the repository
+GIT_ENVIRONMENT = (
+    "GIT_DIR",
+    "GIT_WORK_TREE",
+    "GIT_COMMON_DIR",
+)
+
+
+@dataclass
+class GitDirs:
+    """The directories of the git repository containing a path."""
+
+    # The top of the working tree
+    worktree: str
+    # The git directory of the working tree, holding HEAD
+    gitdir: str
+    # The git directory shared by all worktrees, holding config and refs
+    commondir: str
+
+
+def read_file(
+    path: str,
+) -> Optional[str]:
+    """Read a small text file, None if it cannot be read."""
+    try:
+        with open(path) as file:
+            return file.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def find_git_dirs(
+    path: str = ".",
+) -> Optional[GitDirs]:
+    """
+    Find the git directories of the repository containing a path.
+
+    Follows the `gitdir:` indirection of worktrees and submodules, and the `commondir` of worktrees.
+
+    Args:
+        path (str, optional): The path to start from. Defaults to the current directory.
+
+    Returns:
+        Optional[GitDirs]: The directories, or None if there is no repository or git is configured through the environment.
+    """
+
+    if any(os.environ.get(name) for name in GIT_ENVIRONMENT):
+        return None
+
+    path = os.path.abspath(path)
+    while True:
+        git = os.path.join(path, ".git")
+        if os.path.isdir(git):
+            gitdir = git
+            break
+        if os.path.isfile(git):
+            content = (read_file(git) or "").strip()
+            if not content.startswith("gitdir:"):
+                return None
+            gitdir = os.path.normpath(os.path.join(path, content[len("gitdir:") :].strip()))
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+    commondir = gitdir
+    relative = read_file(os.path.join(gitdir, "commondir"))
+    if relative is not None:
+        commondir = os.path.normpath(os.path.join(gitdir, relative.strip()))
+
+    return GitDirs(
+        worktree=path,
+        gitdir=gitdir,
+        commondir=commondir,
+    )
+
+
+def read_config(
+    path: str,
+) -> Optional[configparser.ConfigParser]:
+    """
+    Parse a git config file, or a file in the same format such as .gitmodules.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Optional[configparser.ConfigParser]: The parsed file, or None if it cannot be read or parsed.
+    """
+
+    config = configparser.ConfigParser(strict=False, allow_no_value=True, interpolation=None)
+    try:
+        if not config.read(path):
+            return None
+    except (configparser.Error, UnicodeDecodeError):
+        return None
+
+    return config
+
+
+def read_branch(
+    path: str = ".",
+) -> Optional[str]:
+    """
+    Get the branch checked out in the working tree containing a path, from its HEAD file.
+
+    Args:
+        path (str, optional): A path in the working tree. Defaults to the current directory.
+
+    Returns:
+        Optional[str]: The name of the branch, or None if HEAD is detached or cannot be read.
+    """
+
+    dirs = find_git_dirs(path)
+    # Repositories using reftable keep a placeholder in HEAD
+    if dirs is None or os.path.exists(os.path.join(dirs.commondir, "reftable")):
+        return None
+
+    head = (read_file(os.path.join(dirs.gitdir, "HEAD")) or "").strip()
+    if not head.startswith("ref: refs/heads/"):
+        return None
+
+    return head[len("ref: refs/heads/") :]
+
+
+def read_submodule_paths(
+    path: str = ".",
+) -> Optional[List[str]]:
+    """
+    Get the paths of the submodules declared in the .gitmodules of the working tree containing a path.
+
+    Args:
+        path (str, optional): A path in the working tree. Defaults to the current directory.
+
+    Returns:
+        Optional[List[str]]: The submodule paths relative to the top of the working tree, empty if there
+        is no .gitmodules, or None if it cannot be parsed.
+    """
+
+    dirs = find_git_dirs(path)
+    if dirs is None:
+        return None
+
+    gitmodules = os.path.join(dirs.worktree, ".gitmodules")
+    if not os.path.exists(gitmodules):
+        return []
+    config = read_config(gitmodules)
+    if config is None:
+        return None
+
+    paths = []
+    for section in config.sections():
+        if section.startswith('submodule "') and config[section].get("path"):
+            paths.append(config[section]["path"].strip().strip('"'))
+
+    return paths
@@ -0,0 +1,110 @@
+import csv
+import hashlib
+import re
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+import yaml
+
+# This file contains the reading of issue files for `issues.import`. Each
+# imported issue carries an idempotency key in a hidden marker at the end of
+# its body, so issues already created by a previous run (from any machine)
+# are found in the issue index and not created twice.
+
+MARKER = "<!-- gtasks-import: {key} -->"
+MARKER_PATTERN = re.compile(r"<!-- gtasks-import: (\S+) -->")
+
+# Fields holding lists, which CSV files give as comma separated values
+LIST_FIELDS = (
+    "labels",
+    "assignees",
+)
+
+
+def normalize_entry(
+    entry: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Clean up an issue read from a file.
+
+    Args:
+        entry (Dict[str, Any]): The issue, with at least a `title`.
+
+    Returns:
+        Dict[str, Any]: The issue without empty fields, with its list fields as lists.
+
+    Raises:
+        ValueError: If the issue has no title.
+    """
+
+    entry = {str(key).strip(): value for key, value in entry.items() if value not in (None, "")}
+    for name in LIST_FIELDS:
+        if isinstance(entry.get(name), str):
+            entry[name] = [value.strip() for value in entry[name].split(",") if value.strip()]
+    if not entry.get("title"):
+        raise ValueError(f"An issue has no title: {entry}")
+
+    return entry
+
+
+def load_issue_file(
+    path: str,
+) -> List[Dict[str, Any]]:
+    """
+    Read the issues to import from a YAML or CSV file.
+
+    A YAML file holds a list of issues, or a mapping with an `issues` list. A CSV file has one issue
+    per row, with a header naming the fields. Besides `title`, `label`, `labels`, `assignees`, `body`
+    and `key`, fields fill the sections of the body template of the label (e.g. `description`, `steps`).
+
+    Args:
+        path (str): The path of the file, ending with .csv for CSV files.
+
+    Returns:
+        List[Dict[str, Any]]: The issues.
+
+    Raises:
+        ValueError: If the file cannot be parsed or is not a list of issues.
+    """
+
+    with open(
+        path,
+        "r",
+        newline="",
+    ) as file:
+        try:
+            if path.lower().endswith(".csv"):
+                entries = [*csv.DictReader(file)]
+            else:
+                entries = yaml.safe_load(file)
+        except (csv.Error, yaml.YAMLError) as error:
+            raise ValueError(f"{path} is not valid: {error}") from error
+
+    if isinstance(entries, dict):
+        entries = entries.get("issues")
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError(f"{path} is not a list of issues")
+
+    return [normalize_entry(entry) for entry in entries]
+
+
+def import_key(
+    entry: Dict[str, Any],
+) -> str:
+    """
+    Get the idempotency key of an issue to import.
+
+    Args:
+        entry (Dict[str, Any]): The issue.
+
+    Returns:
+        str: Its `key` field, or a hash of its title and label.
+    """
+
+    if entry.get("key"):
+        return re.sub(r"\s+", "-", str(entry["key"]))
+
+    return hashlib.sha1(f"{entry['title']}\n{entry.get('label', '')}".encode()).hexdigest()[:12]
@@ -0,0 +1,825 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from . import (
+    options,
+)
+from .github import (
+    PER_PAGE,
+    api,
+    fetch_page,
+    iter_pages,
+)
+from .manifest import (
+    cache_dir,
+)
+from .storage import (
+    connect_db,
+    get_meta,
+    set_meta,
+)
+
+# This file contains the local SQLite index of the issues of a repository.
+# The first sync fetches every issue; the next ones only fetch the issues
+# updated since the last one (`since=` cursor), so listing issues reads the
+# index instantly and keeping it up to date costs a small delta request.
+# Titles, bodies and comments are also indexed for full-text search (FTS5).
+
+# Seconds after which listing issues starts a delta sync in the background
+SYNC_INTERVAL = 60
+
+# Bumped when the schema changes; older indexes are rebuilt from scratch, except
+# for the branches, which cannot be fetched again
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    number INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    assignees TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    node_id TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS issues_state ON issues (state, number);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    issue INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_issue ON comments (issue);
+CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5 (title, body, comments);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS branches (
+    issue INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (issue, name)
+);
+CREATE INDEX IF NOT EXISTS branches_name ON branches (name);
+"""
+
+# Weights of the title, body and comments columns when ranking search results
+RANK = "bm25(issues_fts, 10.0, 2.0, 1.0)"
+
+_lock = threading.Lock()
+
+
+@dataclass
+class Issue:
+    """An issue of the index."""
+
+    number: int
+    title: str
+    state: str = "open"
+    labels: List[str] = field(default_factory=list)
+    assignees: List[str] = field(default_factory=list)
+    updated_at: str = ""
+    repo: Optional[str] = None
+    node_id: str = ""
+
+    @classmethod
+    def from_item(
+        cls,
+        item: Dict[str, Any],
+    ) -> "Issue":
+        """Build an issue from a GitHub REST item."""
+        return cls(
+            number=item["number"],
+            title=item["title"],
+            state=item["state"],
+            labels=[label["name"] for label in item.get("labels") or []],
+            assignees=[assignee["login"] for assignee in item.get("assignees") or []],
+            updated_at=item["updated_at"],
+            node_id=item.get("node_id") or "",
+        )
+
+    @classmethod
+    def from_row(
+        cls,
+        row: sqlite3.Row,
+    ) -> "Issue":
+        """Build an issue from a row of the index."""
+        return cls(
+            number=row["number"],
+            title=row["title"],
+            state=row["state"],
+            labels=json.loads(row["labels"]),
+            assignees=json.loads(row["assignees"]),
+            updated_at=row["updated_at"],
+            node_id=row["node_id"],
+        )
+
+
+def index_path(
+    owner: str,
+    repo: str,
+) -> str:
+    """
+    Get the path of the issue index of a repository.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        str: The path of the SQLite database under the gtasks cache directory.
+    """
+
+    return os.path.join(cache_dir(), "repos", owner, repo, "issues.db")
+
+
+def connect(
+    owner: str,
+    repo: str,
+) -> sqlite3.Connection:
+    """
+    Open the issue index of a repository, creating it if needed.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        sqlite3.Connection: The connection, with rows accessible by column name.
+    """
+
+    return connect_db(
+        index_path(owner, repo),
+        SCHEMA,
+        SCHEMA_VERSION,
+        [
+            "issues",
+            "comments",
+            "issues_fts",
+            "meta",
+        ],
+    )
+
+
+def index_text(
+    db: sqlite3.Connection,
+    numbers: List[int],
+) -> None:
+    """
+    Update the full-text index of issues from their title, body and comments.
+
+    Args:
+        db (sqlite3.Connection): The issue index.
+        numbers (List[int]): The numbers of the issues to reindex.
+    """
+
+    for number in set(numbers):
+        db.execute("DELETE FROM issues_fts WHERE rowid = ?", (number,))
+        db.execute(
+            """
+            INSERT INTO issues_fts (rowid, title, body, comments)
+            SELECT
+                issues.number,
+                issues.title,
+                issues.body,
+                (SELECT coalesce(group_concat(comments.body, ' '), '') FROM comments WHERE comments.issue = issues.number)
+            FROM issues WHERE issues.number = ?
+            """,
+            (number,),
+        )
+
+
+def store_issues(
+    db: sqlite3.Connection,
+    items: List[Dict[str, Any]],
+) -> None:
+    """
+    Insert or update issues from GitHub REST items.
+
+    Pull requests, which the issues endpoint also returns, are skipped.
+
+    Args:
+        db (sqlite3.Connection): The issue index.
+        items (List[Dict[str, Any]]): The issues, as returned by the REST API.
+    """
+
+    issues = [item for item in items if "pull_request" not in item]
+    records = [Issue.from_item(item) for item in issues]
+    db.executemany(
+        """
+        INSERT INTO issues (number, title, body, state, labels, assignees, updated_at, node_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (number) DO UPDATE SET
+            title = excluded.title,
+            body = excluded.body,
+            state = excluded.state,
+            labels = excluded.labels,
+            assignees = excluded.assignees,
+            updated_at = excluded.updated_at,
+            node_id = excluded.node_id
+        """,
+        [
+            (
+                issue.number,
+                issue.title,
+                item.get("body") or "",
+                issue.state,
+                json.dumps(issue.labels),
+                json.dumps(issue.assignees),
+                issue.updated_at,
+                issue.node_id,
+            )
+            for issue, item in zip(records, issues)
+        ],
+    )
+    index_text(db, [item["number"] for item in issues])
+
+
+def store_comments(
+    db: sqlite3.Connection,
+    items: List[Dict[str, Any]],
+) -> None:
+    """
+    Insert or update issue comments from GitHub REST items.
+
+    Args:
+        db (sqlite3.Connection): The issue index.
+        items (List[Dict[str, Any]]): The comments, as returned by the REST API.
+    """
+
+    rows = [
+        (
+            item["id"],
+            int(item["issue_url"].rsplit("/", 1)[-1]),
+            item.get("body") or "",
+            item["updated_at"],
+        )
+        for item in items
+    ]
+    db.executemany(
+        "INSERT OR REPLACE INTO comments (id, issue, body, updated_at) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    index_text(db, [row[1] for row in rows])
+
+
+def fetch_since(
+    db: sqlite3.Connection,
+    endpoint: str,
+    cursor: str,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch the items of an endpoint updated since its cursor, oldest first.
+
+    Pages are fetched one at a time, each one asked for with `since=` the last update time seen,
+    rather than by page number. An item updated during the sync moves to the end of the list,
+    where a later page picks it up, instead of shifting the other items into pages already
+    fetched. Items seen twice are kept once, in their latest version.
+
+    Args:
+        db (sqlite3.Connection): The issue index, which stores the cursor.
+        endpoint (str): The REST endpoint, with its query string, sorted by update time, oldest first.
+        cursor (str): The metadata key of the cursor.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The items, or None if a request failed.
+    """
+
+    since = get_meta(db, cursor)
+    items: Dict[int, Dict[str, Any]] = {}
+    page = 1
+    while True:
+        status, _, data, _ = fetch_page(f"{endpoint}&since={since}" if since else endpoint, page)
+        if status != 200:
+            return None
+        for item in data:
+            items[item["id"]] = item
+        if len(data) < PER_PAGE:
+            break
+        # More items than a page share the last update time: go on by page number for them
+        if data[-1]["updated_at"] == since:
+            page += 1
+        else:
+            since = data[-1]["updated_at"]
+            page = 1
+
+    return [*items.values()]
+
+
+def store_issue(
+    owner: str,
+    repo: str,
+    item: Dict[str, Any],
+) -> None:
+    """
+    Record an issue just created or changed by a task, so the index does not wait for the next sync.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        item (Dict[str, Any]): The issue, as returned by the REST API.
+    """
+
+    db = connect(owner, repo)
+    try:
+        with db:
+            store_issues(db, [item])
+    finally:
+        db.close()
+
+
+def sync(
+    owner: str,
+    repo: str,
+) -> Optional[int]:
+    """
+    Fetch the issues and comments updated since the last sync into the index.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        Optional[int]: The number of issues fetched, or None if a request failed.
+    """
+
+    # One sync at a time per process, background syncs included
+    with _lock:
+        db = connect(owner, repo)
+        try:
+            items = fetch_since(
+                db,
+                f"repos/{owner}/{repo}/issues?state=all&sort=updated&direction=asc",
+                "since",
+            )
+            comments = fetch_since(
+                db,
+                f"repos/{owner}/{repo}/issues/comments?sort=updated&direction=asc",
+                "comments_since",
+            )
+            if items is None or comments is None:
+                return None
+
+            with db:
+                store_issues(db, items)
+                store_comments(db, comments)
+                # `since` is inclusive, so the last item is fetched again next time, which is harmless
+                if items:
+                    set_meta(db, "since", max(item["updated_at"] for item in items))
+                if comments:
+                    set_meta(db, "comments_since", max(item["updated_at"] for item in comments))
+                if get_meta(db, "viewer") is None:
+                    response = api("GET", "user")
+                    if response.status == 200:
+                        set_meta(db, "viewer", response.json()["login"])
+                set_meta(db, "synced_at", str(time.time()))
+        finally:
+            db.close()
+
+    return len(items)
+
+
+def synced_at(
+    owner: str,
+    repo: str,
+) -> Optional[float]:
+    """
+    Get when the index of a repository was last synced.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        Optional[float]: The time of the last sync, or None if the index was never synced.
+    """
+
+    db = connect(owner, repo)
+    try:
+        value = get_meta(db, "synced_at")
+    finally:
+        db.close()
+
+    return None if value is None else float(value)
+
+
+def ensure_synced(
+    owner: str,
+    repo: str,
+) -> None:
+    """
+    Make sure the index can be read.
+
+    An index that was never synced is synced first, as is any index with `--refresh`. An index
+    last synced more than `SYNC_INTERVAL` seconds ago is synced in the background.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Raises:
+        RuntimeError: If the index had to be synced first and the sync failed.
+    """
+
+    last = synced_at(owner, repo)
+    if last is None or options.refresh:
+        if sync(owner, repo) is None:
+            raise RuntimeError(f"Could not sync the issues of {owner}/{repo}")
+    elif time.time() - last > SYNC_INTERVAL:
+        threading.Thread(target=sync, args=(owner, repo)).start()
+
+
+def get_viewer() -> str:
+    """
+    Get the login of the authenticated user.
+
+    Returns:
+        str: The login.
+
+    Raises:
+        RuntimeError: If the user could not be fetched.
+    """
+
+    response = api("GET", "user")
+    if response.status != 200:
+        raise RuntimeError(
+            f"Could not get the authenticated user: {response.status} {response.body.strip()[:200]}"
+        )
+
+    return response.json()["login"]
+
+
+def stream_issues(
+    owner: str,
+    repo: str,
+    assignee: str = "@me",
+    state: str = "open",
+) -> Iterator[Issue]:
+    """
+    Fetch issues from GitHub page by page, newest first, yielding each page as it arrives.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        assignee (str, optional): "@me", a login, "none" for unassigned issues or "all-open" for any. Defaults to "@me".
+        state (str, optional): The state of the issues. Defaults to "open".
+
+    Yields:
+        Issue: The issues.
+
+    Raises:
+        RuntimeError: If the issues or, for "@me", the authenticated user could not be fetched.
+    """
+
+    if assignee == "@me":
+        assignee = get_viewer()
+    endpoint = f"repos/{owner}/{repo}/issues?state={state}&sort=created&direction=desc"
+    if assignee != "all-open":
+        endpoint += f"&assignee={assignee}"
+
+    for items in iter_pages(endpoint):
+        for item in items:
+            if "pull_request" not in item:
+                yield Issue.from_item(item)
+
+
+def iter_issues(
+    owner: str,
+    repo: str,
+    assignee: str = "@me",
+    state: str = "open",
+) -> Iterator[Issue]:
+    """
+    Iterate over the issues of a repository, newest first.
+
+    Issues are read from the index with a cursor, so memory use does not grow with the backlog.
+    While the index was never synced, they are streamed from GitHub instead: the first sync fetches every issue
+    and comment, which takes minutes on large repositories, so it is left to `issues.sync`.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        assignee (str, optional): "@me", a login, "none" for unassigned issues or "all-open" for any. Defaults to "@me".
+        state (str, optional): The state of the issues. Defaults to "open".
+
+    Yields:
+        Issue: The issues.
+
+    Raises:
+        RuntimeError: If the issues could not be fetched.
+    """
+
+    if synced_at(owner, repo) is None and not options.refresh:
+        print("The issue index is not built yet, run `gtasks issues.sync` to list issues instantly")
+        yield from stream_issues(owner, repo, assignee, state)
+        return
+
+    ensure_synced(owner, repo)
+
+    db = connect(owner, repo)
+    try:
+        sql = "SELECT * FROM issues WHERE state = ?"
+        params: List[Any] = [state]
+        if assignee == "none":
+            sql += " AND assignees = '[]'"
+        elif assignee != "all-open":
+            if assignee == "@me":
+                assignee = get_meta(db, "viewer") or get_viewer()
+            sql += " AND EXISTS (SELECT 1 FROM json_each(issues.assignees) WHERE value = ?)"
+            params.append(assignee)
+        for row in db.execute(sql + " ORDER BY number DESC", params):
+            yield Issue.from_row(row)
+    finally:
+        db.close()
+
+
+def search_issues(
+    owner: str,
+    repo: str,
+    text: str,
+    limit: int = 10,
+    match_all: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Search the titles, bodies and comments of the indexed issues.
+
+    The index is not synced, so this never waits for the network.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        text (str): The words to search for.
+        limit (int, optional): The maximum number of results. Defaults to 10.
+        match_all (bool, optional): Whether issues must contain every word, rather than any. Defaults to True.
+
+    Returns:
+        List[Dict[str, Any]]: The matching issues with their number, title and state, best match first.
+    """
+
+    words = re.findall(r"\w+", text)
+    if not words:
+        return []
+
+    db = connect(owner, repo)
+    try:
+        rows = db.execute(
+            f"""
+            SELECT issues.number, issues.title, issues.state
+            FROM issues_fts JOIN issues ON issues.number = issues_fts.rowid
+            WHERE issues_fts MATCH ?
+            ORDER BY {RANK}
+            LIMIT ?
+            """,
+            (
+                (" AND " if match_all else " OR ").join(f'"{word}"' for word in words),
+                limit,
+            ),
+        ).fetchall()
+    finally:
+        db.close()
+
+    return [dict(row) for row in rows]
+
+
+def filter_issues(
+    owner: str,
+    repo: str,
+    state: str = "open",
+    label: Optional[str] = None,
+    assignee: Optional[str] = None,
+    text: Optional[str] = None,
+) -> List[int]:
+    """
+    Select issues of the index by state, label, assignee and words.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        state (str, optional): The state of the issues. Defaults to "open".
+        label (str, optional): A label the issues must have.
+        assignee (str, optional): "@me", a login or "none" for unassigned issues.
+        text (str, optional): Words the title, body or comments must all contain.
+
+    Returns:
+        List[int]: The numbers of the matching issues, newest first.
+
+    Raises:
+        RuntimeError: If the assignee is "@me" and the authenticated user could not be fetched.
+    """
+
+    db = connect(owner, repo)
+    try:
+        sql = "SELECT number FROM issues WHERE state = ?"
+        params: List[Any] = [state]
+        if label:
+            sql += " AND EXISTS (SELECT 1 FROM json_each(issues.labels) WHERE value = ?)"
+            params.append(label)
+        if assignee == "none":
+            sql += " AND assignees = '[]'"
+        elif assignee:
+            if assignee == "@me":
+                assignee = get_meta(db, "viewer") or get_viewer()
+            sql += " AND EXISTS (SELECT 1 FROM json_each(issues.assignees) WHERE value = ?)"
+            params.append(assignee)
+        words = re.findall(r"\w+", text or "")
+        if words:
+            sql += " AND number IN (SELECT rowid FROM issues_fts WHERE issues_fts MATCH ?)"
+            params.append(" AND ".join(f'"{word}"' for word in words))
+        rows = db.execute(sql + " ORDER BY number DESC", params).fetchall()
+    finally:
+        db.close()
+
+    return [row["number"] for row in rows]
+
+
+def find_bodies(
+    owner: str,
+    repo: str,
+    text: str,
+) -> Iterator[tuple]:
+    """
+    Find the issues of the index whose body contains a text, in any state.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        text (str): The text to look for.
+
+    Yields:
+        tuple: The number and the body of each issue.
+    """
+
+    db = connect(owner, repo)
+    try:
+        for row in db.execute("SELECT number, body FROM issues WHERE instr(body, ?) > 0", (text,)):
+            yield row["number"], row["body"]
+    finally:
+        db.close()
+
+
+def get_issue(
+    owner: str,
+    repo: str,
+    number: int,
+) -> Optional[Issue]:
+    """
+    Get an issue from the index.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        number (int): The number of the issue.
+
+    Returns:
+        Optional[Issue]: The issue, or None if it is not indexed.
+    """
+
+    db = connect(owner, repo)
+    try:
+        row = db.execute("SELECT * FROM issues WHERE number = ?", (number,)).fetchone()
+    finally:
+        db.close()
+
+    return None if row is None else Issue.from_row(row)
+
+
+def link_branch(
+    owner: str,
+    repo: str,
+    number: int,
+    branch: str,
+) -> None:
+    """
+    Record that a branch was created for an issue.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        number (int): The number of the issue.
+        branch (str): The name of the branch.
+    """
+
+    db = connect(owner, repo)
+    try:
+        with db:
+            db.execute(
+                "INSERT OR IGNORE INTO branches (issue, name) VALUES (?, ?)", (number, branch)
+            )
+    finally:
+        db.close()
+
+
+def issue_branches(
+    owner: str,
+    repo: str,
+    number: int,
+) -> List[str]:
+    """
+    Get the branches recorded for an issue.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        number (int): The number of the issue.
+
+    Returns:
+        List[str]: The names of the branches.
+    """
+
+    db = connect(owner, repo)
+    try:
+        rows = db.execute(
+            "SELECT name FROM branches WHERE issue = ? ORDER BY name", (number,)
+        ).fetchall()
+    finally:
+        db.close()
+
+    return [row["name"] for row in rows]
+
+
+def unlink_branches(
+    owner: str,
+    repo: str,
+    branches: List[str],
+) -> None:
+    """
+    Forget deleted branches.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        branches (List[str]): The names of the branches.
+    """
+
+    db = connect(owner, repo)
+    try:
+        with db:
+            db.executemany(
+                "DELETE FROM branches WHERE name = ?", [(branch,) for branch in branches]
+            )
+    finally:
+        db.close()
+
+
+def branch_issues(
+    owner: str,
+    repo: str,
+) -> Dict[str, int]:
+    """
+    Get the issue of every recorded branch.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        Dict[str, int]: The issue number of each branch name.
+    """
+
+    db = connect(owner, repo)
+    try:
+        rows = db.execute("SELECT issue, name FROM branches").fetchall()
+    finally:
+        db.close()
+
+    return {row["name"]: row["issue"] for row in rows}
+
+
+def closed_issues(
+    owner: str,
+    repo: str,
+) -> set:
+    """
+    Get the numbers of the closed issues of the index.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        set: The numbers of the closed issues.
+    """
+
+    db = connect(owner, repo)
+    try:
+        rows = db.execute("SELECT number FROM issues WHERE state = 'closed'").fetchall()
+    finally:
+        db.close()
+
+    return {row["number"] for row in rows}
@@ -1,11 +1,17 @@
+import itertools
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
 from typing import (
+    Dict,
+    Iterator,
     List,
 )
 
 import inquirer
 from invoke import (
     Collection,
-    run,
+    Exit,
 )
 from invoke.context import (
     Context,
@@ -14,16 +20,49 @@ from invoke.tasks import (
     task,
 )
 
+from ._getowner import get_owner_repo
+from .aggregate import (
+    iter_aggregated,
+)
 from .base import (
     get_assignee,
     get_label_selected,
-    
+    get_labels,
+    parse_collaborators,
+    select_choice,
 )
-
-from ._getowner import get_owner_repo
-
 from .branch import (
-    delete_branch,
+    delete_issue_branches,
+)
+from .bulk import (
+    parse_ids,
+    run_bulk,
+)
+from .github import (
+    MAX_WORKERS,
+    Response,
+    api,
+)
+from .issue_import import (
+    MARKER,
+    MARKER_PATTERN,
+    import_key,
+    load_issue_file,
+)
+from .issue_index import (
+    Issue,
+    ensure_synced,
+    filter_issues,
+    find_bodies,
+    iter_issues,
+    search_issues,
+    store_issue,
+)
+from .issue_index import (
+    sync as sync_issues,
+)
+from .prefetch import (
+    prefetch,
 )
 
 # This script is used to manage issues in a GitHub repository
@@ -31,9 +70,11 @@ from .branch import (
 
 def get_issues(
     assignee: str = "@me",
-) -> List[str]:
+) -> Iterator[Issue]:
     """
-    Get the list of issues assigned to the user.
+    Get the open issues assigned to the user.
+
+    The issues are read from the local issue index, which is synced incrementally, and yielded one at a time.
 
     By default, it gets the issues assigned to the user running the script. If the assignee is specified, it gets the issues assigned to that user.
 
@@ -42,16 +83,67 @@ def get_issues(
     Args:
         assignee (str, optional): The assignee of the issues. Defaults to "@me".
 
-        Returns:
-        List[str]: The list of issues assigned to the user
+    Returns:
+        Iterator[Issue]: The open issues assigned to the user, newest first.
     """
 
-    issues_list = run(
-        f"gh issue list --assignee={assignee}",
-        hide=True,
-    )
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+
+    return iter_issues(owner, repo, assignee)
+
+
+# Sections of the issue body per label, as (field, heading)
+ISSUE_TEMPLATES = {
+    "bug": [
+        ("description", "Description"),
+        ("steps", "Steps to Reproduce the Problem"),
+        ("expected", "Expected Behavior"),
+        ("actual", "Actual Behavior"),
+        ("additional", "Additional Information"),
+    ],
+    "docs": [
+        ("description", "Description"),
+        ("location", "Location"),
+        ("type", "Issue Type"),
+        ("details", "Details"),
+        ("suggestion", "Suggestion"),
+        ("additional", "Additional Information"),
+    ],
+    "feat": [
+        ("description", "Description"),
+        ("solution", "Solution"),
+        ("alternatives", "Alternatives"),
+        ("additional", "Additional Information"),
+    ],
+}
+
+
+def render_issue_body(
+    label: str,
+    fields: Dict[str, str],
+) -> str:
+    """
+    Render the body of an issue from the template of its label.
+
+    Args:
+        label (str): The label of the issue.
+        fields (Dict[str, str]): The value of each section, e.g. "description" or "steps". Missing sections are left empty.
+
+    Returns:
+        str: The body of the issue. Labels without a template use the "description" field as is.
+    """
+
+    if label not in ISSUE_TEMPLATES:
+        return fields.get("description", "")
 
-    return issues_list.stdout.strip().split("\n")
+    body = ""
+    for name, heading in ISSUE_TEMPLATES[label]:
+        body += f"## {heading}\n\n"
+        body += f"{fields.get(name, '')}\n\n"
+    return body
 
 
 def body_issue_docs() -> str:
@@ -94,19 +186,17 @@ def body_issue_docs() -> str:
         default="",
     )
 
-    body = "## Description\n\n"
-    body += f"{description}\n\n"
-    body += "## Location\n\n"
-    body += f"{location}\n\n"
-    body += "## Issue Type\n\n"
-    body += f"{issue_type}\n\n"
-    body += "## Details\n\n"
-    body += f"{details}\n\n"
-    body += "## Suggestion\n\n"
-    body += f"{suggestion}\n\n"
-    body += "## Additional Information\n\n"
-    body += f"{additional}\n\n"
-    return body
+    return render_issue_body(
+        "docs",
+        {
+            "description": description,
+            "location": location,
+            "type": issue_type,
+            "details": details,
+            "suggestion": suggestion,
+            "additional": additional,
+        },
+    )
 
 
 def body_issue_feat() -> str:
@@ -129,15 +219,15 @@ def body_issue_feat() -> str:
         default="",
     )
 
-    body = "## Description\n\n"
-    body += f"{description}\n\n"
-    body += "## Solution\n\n"
-    body += f"{solution}\n\n"
-    body += "## Alternatives\n\n"
-    body += f"{alternatives}\n\n"
-    body += "## Additional Information\n\n"
-    body += f"{additional}\n\n"
-    return body
+    return render_issue_body(
+        "feat",
+        {
+            "description": description,
+            "solution": solution,
+            "alternatives": alternatives,
+            "additional": additional,
+        },
+    )
 
 
 def get_issue_body(
@@ -182,17 +272,302 @@ def body_issue_bug() -> str:
         default="",
     )
 
-    body = "## Description\n\n"
-    body += f"{description}\n\n"
-    body += "## Steps to Reproduce the Problem\n\n"
-    body += f"{steps}\n\n"
-    body += "## Expected Behavior\n\n"
-    body += f"{expected}\n\n"
-    body += "## Actual Behavior\n\n"
-    body += f"{actual}\n\n"
-    body += "## Additional Information\n\n"
-    body += f"{additional}\n\n"
-    return body
+    return render_issue_body(
+        "bug",
+        {
+            "description": description,
+            "steps": steps,
+            "expected": expected,
+            "actual": actual,
+            "additional": additional,
+        },
+    )
+
+
+def create_issue(
+    owner: str,
+    repo: str,
+    title: str,
+    body: str,
+    labels: List[str],
+    assignees: List[str],
+) -> dict:
+    """
+    Create an issue with the GitHub API.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        title (str): The title of the issue.
+        body (str): The body of the issue.
+        labels (List[str]): The labels of the issue.
+        assignees (List[str]): The assignees of the issue.
+
+    Returns:
+        dict: The created issue.
+    """
+
+    response = api(
+        "POST",
+        f"repos/{owner}/{repo}/issues",
+        {
+            "title": title,
+            "body": body,
+            "labels": labels,
+            "assignees": assignees,
+        },
+    )
+    if response.status != 201:
+        raise Exit(f"Could not create the issue: {response.status} {response.body}")
+
+    issue = response.json()
+    store_issue(owner, repo, issue)
+
+    return issue
+
+
+def close_issue(
+    owner: str,
+    repo: str,
+    issue_id: str,
+) -> None:
+    """
+    Close an issue with the GitHub API.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        issue_id (str): The number of the issue.
+    """
+
+    response = api(
+        "PATCH",
+        f"repos/{owner}/{repo}/issues/{issue_id}",
+        {"state": "closed"},
+    )
+    if response.status != 200:
+        raise Exit(f"Could not close issue {issue_id}: {response.status} {response.body}")
+
+    store_issue(owner, repo, response.json())
+    print(f"Closed issue {issue_id}")
+
+
+def select_issues(
+    owner: str,
+    repo: str,
+    ids: str = None,
+    state: str = "open",
+    label: str = None,
+    assignee: str = None,
+    query: str = None,
+) -> List[int]:
+    """
+    Select the issues of a bulk operation, from a list of IDs or a filter on the local issue index.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+        ids (str, optional): IDs and ranges, e.g. "12,15,20-30".
+        state (str, optional): The state of the filtered issues. Defaults to "open".
+        label (str, optional): A label the filtered issues must have.
+        assignee (str, optional): The assignee of the filtered issues, "@me", a login or "none".
+        query (str, optional): Words the filtered issues must contain.
+
+    Returns:
+        List[int]: The issue numbers, after the user confirmed them.
+    """
+
+    if ids:
+        try:
+            numbers = parse_ids(ids)
+        except ValueError as error:
+            raise Exit(str(error))
+    elif label or assignee or query:
+        try:
+            ensure_synced(owner, repo)
+            numbers = filter_issues(owner, repo, state, label, assignee, query)
+        except RuntimeError as error:
+            raise Exit(str(error))
+    else:
+        raise Exit("Give issue IDs or a filter (--label, --assignee or --query)")
+
+    if not numbers:
+        raise Exit("No issues selected")
+    preview = ", ".join(str(number) for number in numbers[:20])
+    if len(numbers) > 20:
+        preview += ", ..."
+    if not inquirer.confirm(
+        f"Apply to {len(numbers)} issues ({preview})?",
+        default=True,
+    ):
+        raise Exit("Aborted")
+
+    return numbers
+
+
+def set_state(
+    state: str,
+    ids: str,
+    label: str,
+    assignee: str,
+    query: str,
+) -> None:
+    """Close or reopen many issues, see `bulk_close`."""
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    numbers = select_issues(owner, repo, ids, "open" if state == "closed" else "closed", label, assignee, query)
+
+    def update(number: int) -> Response:
+        response = api("PATCH", f"repos/{owner}/{repo}/issues/{number}", {"state": state})
+        if response.status == 200:
+            store_issue(owner, repo, response.json())
+        return response
+
+    if run_bulk(owner, repo, "closed" if state == "closed" else "reopened", numbers, update):
+        raise Exit(code=1)
+
+
+BULK_HELP = {
+    "ids": "The IDs of the issues, with ranges, e.g. '12,15,20-30'",
+    "label": "Select the issues with this label",
+    "assignee": "Select the issues assigned to this user, '@me' or 'none'",
+    "query": "Select the issues containing these words",
+}
+
+
+@task(help=BULK_HELP)
+def bulk_close(
+    ctx: Context,
+    ids: str = None,
+    label: str = None,
+    assignee: str = None,
+    query: str = None,
+) -> None:
+    """
+    Close many issues at once.
+
+    The issues are given as a list of IDs and ranges, or selected with a filter on the local issue index. They are closed concurrently and each result is reported. If some fail, running the same command again retries them and skips the ones already closed.
+
+    Args:
+        ids (str, optional): The IDs of the issues, e.g. "12,15,20-30".
+        label (str, optional): Select the open issues with this label.
+        assignee (str, optional): Select the open issues assigned to this user.
+        query (str, optional): Select the open issues containing these words.
+
+    Returns:
+        None
+    """
+
+    set_state("closed", ids, label, assignee, query)
+
+
+@task(help=BULK_HELP)
+def bulk_reopen(
+    ctx: Context,
+    ids: str = None,
+    label: str = None,
+    assignee: str = None,
+    query: str = None,
+) -> None:
+    """
+    Reopen many issues at once.
+
+    Works like `bulk-close`, filters select closed issues.
+
+    Args:
+        ids (str, optional): The IDs of the issues, e.g. "12,15,20-30".
+        label (str, optional): Select the closed issues with this label.
+        assignee (str, optional): Select the closed issues assigned to this user.
+        query (str, optional): Select the closed issues containing these words.
+
+    Returns:
+        None
+    """
+
+    set_state("open", ids, label, assignee, query)
+
+
+@task(help={"add": "The labels to add, separated by commas", **BULK_HELP})
+def bulk_label(
+    ctx: Context,
+    add: str,
+    ids: str = None,
+    label: str = None,
+    assignee: str = None,
+    query: str = None,
+) -> None:
+    """
+    Add labels to many issues at once.
+
+    Works like `bulk-close`, filters select open issues.
+
+    Args:
+        add (str): The labels to add, separated by commas.
+        ids (str, optional): The IDs of the issues, e.g. "12,15,20-30".
+        label (str, optional): Select the open issues with this label.
+        assignee (str, optional): Select the open issues assigned to this user.
+        query (str, optional): Select the open issues containing these words.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    labels = [name.strip() for name in add.split(",") if name.strip()]
+    numbers = select_issues(owner, repo, ids, "open", label, assignee, query)
+
+    def update(number: int) -> Response:
+        return api("POST", f"repos/{owner}/{repo}/issues/{number}/labels", {"labels": labels})
+
+    if run_bulk(owner, repo, "labeled", numbers, update, key={"labels": labels}):
+        raise Exit(code=1)
+
+
+@task(help={"to": "The users to assign, separated by commas", **BULK_HELP})
+def bulk_assign(
+    ctx: Context,
+    to: str,
+    ids: str = None,
+    label: str = None,
+    assignee: str = None,
+    query: str = None,
+) -> None:
+    """
+    Assign many issues at once.
+
+    Works like `bulk-close`, filters select open issues.
+
+    Args:
+        to (str): The users to assign, separated by commas.
+        ids (str, optional): The IDs of the issues, e.g. "12,15,20-30".
+        label (str, optional): Select the open issues with this label.
+        assignee (str, optional): Select the open issues assigned to this user.
+        query (str, optional): Select the open issues containing these words.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    assignees = [name.strip() for name in to.split(",") if name.strip()]
+    numbers = select_issues(owner, repo, ids, "open", label, assignee, query)
+
+    def update(number: int) -> Response:
+        response = api("POST", f"repos/{owner}/{repo}/issues/{number}/assignees", {"assignees": assignees})
+        if response.status == 201:
+            store_issue(owner, repo, response.json())
+        return response
+
+    if run_bulk(owner, repo, "assigned", numbers, update, expected=201, key={"assignees": assignees}):
+        raise Exit(code=1)
 
 
 @task(
@@ -208,7 +583,7 @@ def close(
     """
     Close an issue.
 
-    This function uses the GitHub CLI to close an issue. If the issue ID is not provided, it prompts the user to enter one.
+    This function uses the GitHub API to close an issue. If the issue ID is not provided, it prompts the user to enter one.
 
     Args:
         issue_id (str, optional): The ID of the issue to close.
@@ -219,39 +594,56 @@ def close(
     """
 
     if issue_id is None:
-        issues = get_issues(assignee)
+        issues = [f"{issue.number} - {issue.title}" for issue in get_issues(assignee)]
         issues.append("Other")
-        issue_id = inquirer.text(
-            "Enter the issue ID to close",
-            choices=issues,
+        issue_id = select_choice(
+            "issue",
+            "Select the issue to close",
+            issues,
         )
 
         if issue_id == "Other":
             issue_id = inquirer.text("Enter the issue ID to close")
-            issue_id = issue_id.split(" ")[0]
+        issue_id = issue_id.split(" ")[0]
 
-    run(f"gh issue close {issue_id}")
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    close_issue(
+        owner,
+        repo,
+        issue_id,
+    )
 
     if inquirer.confirm(
-        "Do you want to delete the branch?",
+        "Do you want to delete the branches of the issue?",
         default=True,
     ):
-        delete_branch()
+        delete_issue_branches(owner, repo, issue_id)
 
 
 @task(
     help={
         "assignee": "The assignee of the issues. Defaults to '@me'. Use 'all-open' to get all issues. Use 'none' to get unassigned issues. Use the username to get issues assigned to that user.",
+        "limit": "The maximum number of issues to list. Defaults to 30.",
+        "all": "List every issue, without limit",
+        "org": "List the issues of every repository of this organization or user",
+        "repos": "List the issues of these repositories, as 'owner/repo' separated by commas",
     }
 )
 def list(
     ctx: Context,
     assignee: str = "@me",
+    limit: int = 30,
+    all: bool = False,
+    org: str = None,
+    repos: str = None,
 ) -> None:
     """
     List the open issues assigned to the user.
 
-    This function uses the GitHub CLI to list the open issues assigned to the user. By default, it lists the issues assigned to the user running the script. If the assignee is specified, it lists the issues assigned to that user.
+    This function lists the open issues assigned to the user from the local issue index. By default, it lists the issues assigned to the user running the script. If the assignee is specified, it lists the issues assigned to that user.
 
     Other options for the assignee are:
     - `all-open`: Get all open issues
@@ -259,25 +651,180 @@ def list(
 
     You can specify the assignee using the `--assignee` flag.
 
+    With `--org` or `--repos`, it lists the issues of many repositories at once with GitHub searches instead, cached for a few minutes.
+
+    Issues are printed as they are read, so the first ones show up right away even with `--all` on a large backlog.
+
     Args:
         assignee (str, optional): The assignee of the issues. Defaults to "@me".
+        limit (int, optional): The maximum number of issues to list. Defaults to 30.
+        all (bool, optional): List every issue, without limit. Defaults to False.
+        org (str, optional): List the issues of every repository of this organization or user.
+        repos (str, optional): List the issues of these repositories, separated by commas.
 
     Returns:
         None
 
     """
-    lines = get_issues(assignee)
+    if org or repos:
+        repo_list = [repo.strip() for repo in (repos or "").split(",") if repo.strip()]
+        issues = iter_aggregated(assignee, org, repo_list)
+    else:
+        issues = get_issues(assignee)
+    if not all:
+        issues = itertools.islice(issues, limit)
 
     print(f"Open Issues Assigned to {assignee}:")
 
-    if lines == [""]:
+    found = False
+    try:
+        for issue in issues:
+            found = True
+            prefix = f"{issue.repo}#" if issue.repo else ""
+            print(f"{prefix}{issue.number} - {issue.title}", flush=True)
+    except RuntimeError as error:
+        raise Exit(str(error))
+
+    if not found:
         print("No issues found")
-    else:
-        for line in lines:
-            parts = line.split("\t")
-            issue_id = parts[0]
-            title = parts[2]
-            print(f"{issue_id} - {title}")
+
+
+@task(
+    help={
+        "query": "The words to search for in the titles, bodies and comments of the issues",
+        "limit": "The maximum number of results. Defaults to 10.",
+    }
+)
+def search(
+    ctx: Context,
+    query: str,
+    limit: int = 10,
+) -> None:
+    """
+    Search the issues of the repository.
+
+    This function searches the titles, bodies and comments of the issues in the local issue index, open and closed, and prints the best matches first.
+
+    Args:
+        query (str): The words to search for.
+        limit (int, optional): The maximum number of results. Defaults to 10.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    try:
+        ensure_synced(owner, repo)
+    except RuntimeError as error:
+        raise Exit(str(error))
+
+    results = search_issues(owner, repo, query, limit)
+    if not results:
+        print("No issues found")
+    for issue in results:
+        print(f"{issue['number']} - {issue['title']} [{issue['state']}]")
+
+
+@task(
+    name="import",
+    help={
+        "path": "The YAML or CSV file listing the issues",
+    },
+)
+def import_issues(
+    ctx: Context,
+    path: str,
+) -> None:
+    """
+    Create many issues from a YAML or CSV file.
+
+    Each issue has a `title`, and optionally a `label` whose body template is filled from the other fields (e.g. `description`, `steps`), extra `labels`, `assignees`, a ready-made `body` and an idempotency `key`. The issues are created concurrently. Issues already created by a previous import, with the same key (by default a hash of the title and label), are skipped, so the file can be imported again after a failure without creating duplicates.
+
+    Args:
+        path (str): The YAML or CSV file listing the issues.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    try:
+        entries = load_issue_file(path)
+    except (OSError, ValueError) as error:
+        raise Exit(f"Could not read {path}: {error}")
+
+    # Bring the index up to date, so issues imported from elsewhere are seen
+    if sync_issues(owner, repo) is None:
+        raise Exit("Could not sync the issues")
+    imported = {
+        key: number
+        for number, body in find_bodies(owner, repo, "gtasks-import:")
+        for key in MARKER_PATTERN.findall(body)
+    }
+
+    pending = {}
+    for entry in entries:
+        key = import_key(entry)
+        if key in imported:
+            print(f"{imported[key]} - {entry['title']} (already imported)")
+        else:
+            pending.setdefault(key, entry)
+
+    def create(key: str, entry: Dict) -> bool:
+        label = entry.get("label")
+        body = entry["body"] if "body" in entry else render_issue_body(label, entry)
+        try:
+            issue = create_issue(
+                owner,
+                repo,
+                entry["title"],
+                f"{body}\n{MARKER.format(key=key)}\n",
+                [label, *entry.get("labels", [])] if label else entry.get("labels", []),
+                entry.get("assignees", []),
+            )
+        except Exit as error:
+            print(f"{entry['title']}: failed ({error.message})")
+            return False
+        print(f"{issue['number']} - {entry['title']}")
+        return True
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        results = [*pool.map(create, pending.keys(), pending.values())]
+
+    print(f"{results.count(True)} issues created, {results.count(False)} failed, {len(entries) - len(pending)} skipped")
+    if not all(results):
+        raise Exit("Import the same file again to retry the failed issues", code=1)
+
+
+@task
+def sync(
+    ctx: Context,
+) -> None:
+    """
+    Sync the local issue index.
+
+    Only the issues updated since the last sync are fetched.
+
+    Returns:
+        None
+    """
+
+    (
+        owner,
+        repo,
+    ) = get_owner_repo()
+    count = sync_issues(owner, repo)
+    if count is None:
+        raise Exit("Could not sync the issues")
+
+    print(f"Synced {count} issues")
 
 
 @task
@@ -287,7 +834,7 @@ def new(
     """
     Create a new issue.
 
-    This function uses the GitHub CLI to create a new issue. It prompts the user to enter the issue title, label, and assignee. It then constructs the body of the issue based on the label and creates a new issue.
+    This function uses the GitHub API to create a new issue. It prompts the user to enter the issue title, label, and assignee. It then constructs the body of the issue based on the label and creates a new issue.
 
     Returns:
         None
@@ -299,27 +846,60 @@ def new(
         repo,
     ) = get_owner_repo()
 
+    # Fetch the choices while the user types the title and body
+    prefetch(get_labels, owner, repo)
+    prefetch(parse_collaborators, owner, repo)
+    prefetch(ensure_synced, owner, repo)
+
     title = inquirer.text("Enter the issue title")
+
+    # Look for duplicates in the local index, without waiting for the network
+    duplicates = search_issues(owner, repo, title, 5, match_all=False)
+    if duplicates:
+        print("Similar issues:")
+        for issue in duplicates:
+            print(f"  {issue['number']} - {issue['title']} [{issue['state']}]")
+        if not inquirer.confirm(
+            "Create the issue anyway?",
+            default=True,
+        ):
+            return
     label = get_label_selected()
 
     body = get_issue_body(label)
 
-    command = f"gh issue create --title='{title}' --body='{body}' --repo='{owner}/{repo}' --label='{label}'"
+    assignees = []
     if inquirer.confirm(
         "Assign this issue to someone? [True]",
         default=True,
     ):
-        assignee = get_assignee(
-            owner,
-            repo,
+        assignees.append(
+            get_assignee(
+                owner,
+                repo,
+            )
         )
-        command += f" --assignee='{assignee}'"
-    run(command)
+    issue = create_issue(
+        owner,
+        repo,
+        title,
+        body,
+        [label],
+        assignees,
+    )
+    print(issue["html_url"])
 
 
 namespace = Collection(
     "issues",
+    bulk_assign,
+    bulk_close,
+    bulk_label,
+    bulk_reopen,
     close,
+    import_issues,
     list,
     new,
+    search,
+    sync,
 )
@@ -1,58 +1,123 @@
+import importlib
+
 from invoke import (
+    Argument,
     Collection,
     Program,
 )
 
-from .branch import (
-    namespace as branch_namespace,
-)
-from .checks import (
-    namespace as checks_namespace,
-)
-from .cleans import (
-    namespace as cleans_namespace,
-)
-from .containers import (
-    namespace as containers_namespace,
-)
-from .docs import (
-    namespace as docs_namespace,
-)
-from .formats import (
-    namespace as formats_namespace,
-)
-from .git import (
-    namespace as git_namespace,
-)
-from .installs import (
-    namespace as installs_namespace,
-)
-from .issues import (
-    namespace as issues_namespace,
-)
-from .projects import (
-    namespace as projects_namespace,
-)
-from .setup_repo import (
-    namespace as setup_namespace,
+from . import (
+    manifest,
+    options,
+    profiler,
 )
 
-# Create a root collection and add both namespaces directly
-ns = Collection()
-ns.add_collection(setup_namespace)  # Add repo tasks directly to root
-ns.add_collection(issues_namespace)  # Add issues tasks directly to root
-ns.add_collection(git_namespace)  # Add repo tasks directly to root
-ns.add_collection(branch_namespace)  # Add branch tasks directly to root
-ns.add_collection(containers_namespace)  # Add containers tasks directly to root
-ns.add_collection(cleans_namespace)  # Add cleans tasks directly to root
-ns.add_collection(checks_namespace)  # Add checks tasks directly to root
-ns.add_collection(docs_namespace)  # Add docs tasks directly to root
-ns.add_collection(projects_namespace)  # Add projects tasks directly to root
-ns.add_collection(formats_namespace)  # Add formats tasks directly to root
-ns.add_collection(installs_namespace)  # Add installs tasks directly to root
-
-# Create an Invoke program with the defined namespace
-program = Program(namespace=ns)
+# Map each root namespace to the module that defines it. Modules are only
+# imported when one of their tasks is requested, so `gtasks cleans.python`
+# does not pay for `inquirer`, `yaml` and the GitHub helpers.
+NAMESPACES = {
+    "setup": "setup_repo",
+    "issues": "issues",
+    "git": "git",
+    "exp": "experiments",
+    "branch": "branch",
+    "containers": "containers",
+    "cleans": "cleans",
+    "checks": "checks",
+    "docs": "docs",
+    "project": "projects",
+    "format": "formats",
+    "installs": "installs",
+    "daemon": "daemon",
+}
+
+
+def load_namespace(
+    names: set[str] | None = None,
+) -> Collection:
+    """
+    Build the root collection from the task modules.
+
+    Args:
+        names (set[str], optional): The namespaces to load. Defaults to all of them.
+
+    Returns:
+        Collection: The root collection holding the requested namespaces.
+    """
+
+    ns = Collection()
+    for name, module in NAMESPACES.items():
+        if names is None or name in names:
+            with profiler.record("import", f"{__package__}.{module}"):
+                ns.add_collection(importlib.import_module(f".{module}", __package__).namespace)
+
+    return ns
+
+
+class LazyProgram(Program):
+    """Invoke program that only imports the task modules needed by argv."""
+
+    def core_args(self) -> list[Argument]:
+        return super().core_args() + [
+            Argument(
+                names=("profile",),
+                kind=bool,
+                default=False,
+                help=f"Profile the run and write a trace (or set {profiler.ENV_VAR}=1).",
+            ),
+            Argument(
+                names=("refresh",),
+                kind=bool,
+                default=False,
+                help="Refresh cached GitHub data such as labels and collaborators.",
+            ),
+        ]
+
+    def parse_core(self, argv: list[str] | None) -> None:
+        super().parse_core(argv)
+        if self.args.profile.value or profiler.requested():
+            profiler.start()
+        options.refresh = self.args.refresh.value
+
+    def requested_namespaces(self) -> set[str] | None:
+        """
+        Get the namespaces referenced on the command line.
+
+        Returns:
+            set[str] | None: The namespaces to load, or `None` to load all of them.
+        """
+
+        names = {
+            word.split(".")[0]
+            for word in self.core.unparsed
+            if not word.startswith("-") and word.split(".")[0] in NAMESPACES
+        }
+
+        return names or None
+
+    def parse_collection(self) -> None:
+        # Listing, help and completion never run a task, so they are answered from the manifest
+        if self.args.list.value or self.args.help.value or self.args.complete.value:
+            self.namespace = manifest.load_collection(load_namespace)
+        else:
+            self.namespace = load_namespace(self.requested_namespaces())
+        super().parse_collection()
+
+    def execute(self) -> None:
+        # Task modules are imported by now, so their prompts can be recorded
+        if profiler.active:
+            profiler.patch_inquirer()
+        super().execute()
+
+    def run(self, argv: list[str] | None = None, exit: bool = True) -> None:
+        try:
+            super().run(argv, exit)
+        finally:
+            profiler.finish()
+
+
+# Create an Invoke program; the placeholder namespace is replaced once argv is parsed
+program = LazyProgram(namespace=Collection())
 
 if __name__ == "__main__":
     program.run()
@@ -0,0 +1,244 @@
+import hashlib
+import inspect
+import json
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+)
+
+from invoke import (
+    Collection,
+    Task,
+)
+
+from .storage import (
+    write_json,
+)
+
+# This file contains the task manifest used to answer --list, --help and
+# --complete without importing the task modules.
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def cache_dir() -> str:
+    """
+    Get the gtasks cache directory.
+
+    Returns:
+        str: `$XDG_CACHE_HOME/gtasks`, defaulting to `~/.cache/gtasks`.
+    """
+
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(root, "gtasks")
+
+
+def manifest_path() -> str:
+    """
+    Get the path of the task manifest.
+
+    Returns:
+        str: The path of the manifest file.
+    """
+
+    return os.path.join(cache_dir(), "manifest.json")
+
+
+def fingerprint() -> str:
+    """
+    Fingerprint the gtasks package files.
+
+    The fingerprint changes whenever a module of the package is added, removed or modified.
+
+    Returns:
+        str: A hash of the package location and the size and mtime of its modules.
+    """
+
+    digest = hashlib.sha1(PACKAGE_DIR.encode())
+    for entry in sorted(os.scandir(PACKAGE_DIR), key=lambda e: e.name):
+        if entry.name.endswith(".py"):
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return digest.hexdigest()
+
+
+def serialize_task(
+    task: Task,
+) -> Dict[str, Any]:
+    """
+    Serialize the metadata invoke needs to list, document and complete a task.
+
+    Args:
+        task (Task): The task to serialize.
+
+    Returns:
+        Dict[str, Any]: The task name, docstring, parameters and parser hints.
+    """
+
+    parameters = []
+    for parameter in task.argspec(task.body).parameters.values():
+        if parameter.default is inspect.Parameter.empty:
+            parameters.append([parameter.name])
+        else:
+            parameters.append([parameter.name, parameter.default])
+
+    return {
+        "doc": task.__doc__,
+        "parameters": parameters,
+        "help": task.help,
+        "aliases": list(task.aliases),
+        "positional": list(task.positional),
+        "optional": list(task.optional),
+        "iterable": list(task.iterable),
+        "incrementable": list(task.incrementable),
+        "auto_shortflags": task.auto_shortflags,
+    }
+
+
+def serialize_collection(
+    collection: Collection,
+) -> Dict[str, Any]:
+    """
+    Serialize a collection and its subcollections.
+
+    Args:
+        collection (Collection): The collection to serialize.
+
+    Returns:
+        Dict[str, Any]: The collection name, default task, tasks and subcollections.
+    """
+
+    return {
+        "name": collection.name,
+        "default": collection.default,
+        "tasks": {name: serialize_task(task) for name, task in collection.tasks.items()},
+        "collections": [serialize_collection(sub) for sub in collection.collections.values()],
+    }
+
+
+def stub_task(
+    name: str,
+    data: Dict[str, Any],
+) -> Task:
+    """
+    Rebuild a task from its manifest entry.
+
+    The task body only carries the docstring and signature; it cannot be executed.
+
+    Args:
+        name (str): The name of the task.
+        data (Dict[str, Any]): The serialized task.
+
+    Returns:
+        Task: A task with the same name, docstring and arguments as the original.
+    """
+
+    def body(*args, **kwargs):
+        raise RuntimeError(f"{name} was loaded from the task manifest and cannot be run")
+
+    parameters = [inspect.Parameter("c", inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    for parameter in data["parameters"]:
+        parameters.append(
+            inspect.Parameter(
+                parameter[0],
+                inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                default=parameter[1] if len(parameter) > 1 else inspect.Parameter.empty,
+            )
+        )
+    body.__name__ = name
+    body.__doc__ = data["doc"]
+    body.__signature__ = inspect.Signature(parameters)
+
+    return Task(
+        body,
+        aliases=data["aliases"],
+        positional=data["positional"],
+        optional=data["optional"],
+        iterable=data["iterable"],
+        incrementable=data["incrementable"],
+        auto_shortflags=data["auto_shortflags"],
+        help=data["help"],
+    )
+
+
+def deserialize_collection(
+    data: Dict[str, Any],
+) -> Collection:
+    """
+    Rebuild a collection of stub tasks from its manifest entry.
+
+    Args:
+        data (Dict[str, Any]): The serialized collection.
+
+    Returns:
+        Collection: A collection that lists, documents and completes like the original.
+    """
+
+    collection = Collection(data["name"]) if data["name"] else Collection()
+    for name, task in data["tasks"].items():
+        collection.add_task(
+            stub_task(name, task),
+            name=name,
+            default=name == data["default"],
+        )
+    for sub in data["collections"]:
+        collection.add_collection(deserialize_collection(sub))
+
+    return collection
+
+
+def write_manifest(
+    collection: Collection,
+    key: str,
+) -> None:
+    """
+    Write the manifest of a collection to the cache directory.
+
+    Errors are ignored: the manifest is an optimization and gtasks works without it.
+
+    Args:
+        collection (Collection): The root collection to serialize.
+        key (str): The package fingerprint the manifest was built from.
+    """
+
+    write_json(
+        manifest_path(),
+        {"fingerprint": key, "namespace": serialize_collection(collection)},
+    )
+
+
+def load_collection(
+    loader: Callable[[], Collection],
+) -> Collection:
+    """
+    Load the root collection from the manifest.
+
+    The manifest is rebuilt with `loader` when it is missing or the package files changed.
+
+    Args:
+        loader (Callable[[], Collection]): Builds the real root collection.
+
+    Returns:
+        Collection: The root collection made of stub tasks.
+    """
+
+    key = fingerprint()
+    try:
+        with open(
+            manifest_path(),
+            "r",
+        ) as file:
+            data = json.load(file)
+        if data["fingerprint"] == key:
+            return deserialize_collection(data["namespace"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    collection = loader()
+    write_manifest(collection, key)
+
+    return collection
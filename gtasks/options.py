@@ -0,0 +1,7 @@
+# This file contains the core options of a run that tasks read, set by
+# `gtasks` once argv is parsed. It imports nothing, so setting them costs
+# nothing for tasks that never read them.
+
+# Set by `gtasks --refresh` to bypass cached GitHub data (labels and
+# collaborators, the issue index, aggregated searches)
+refresh = False
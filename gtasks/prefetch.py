@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import (
+    Future,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+)
+
+# This file contains the background prefetch used to overlap network and git
+# calls with interactive prompts. A call is started with `prefetch` before
+# the prompts and awaited with `result` where its value is needed.
+#
+# Prefetched calls run in daemon threads, so a prefetch that turns out to be
+# unneeded never delays the exit. They must not read the terminal: commands
+# they run should pass `in_stream=False` to invoke.
+
+_futures: Dict[tuple, Future] = {}
+_lock = threading.Lock()
+
+
+def prefetch(
+    function: Callable,
+    *args: Any,
+) -> Future:
+    """
+    Start calling a function in the background.
+
+    Calls are deduplicated: prefetching the same function with the same arguments twice returns the same future.
+    A call that failed is forgotten, so prefetching it again retries it.
+
+    Args:
+        function (Callable): The function to call.
+        *args: The arguments of the call.
+
+    Returns:
+        Future: The future result of the call.
+    """
+
+    key = (function, args)
+    with _lock:
+        if key in _futures:
+            return _futures[key]
+        future = Future()
+        _futures[key] = future
+
+    def work():
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            with _lock:
+                _futures.pop(key, None)
+            future.set_exception(error)
+
+    threading.Thread(target=work, daemon=True).start()
+
+    return future
+
+
+def result(
+    function: Callable,
+    *args: Any,
+) -> Any:
+    """
+    Get the result of a prefetched call, starting it now if it was not prefetched.
+
+    Args:
+        function (Callable): The function to call.
+        *args: The arguments of the call.
+
+    Returns:
+        Any: The return value of the call. Exceptions of the call are raised here.
+    """
+
+    return prefetch(function, *args).result()
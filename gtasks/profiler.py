@@ -0,0 +1,336 @@
+import contextlib
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+)
+
+from invoke.runners import (
+    Runner,
+)
+from invoke.tasks import (
+    Task,
+)
+
+from .manifest import (
+    cache_dir,
+)
+
+# This file contains the opt-in profiler enabled with `gtasks --profile` or
+# GTASKS_PROFILE=1. It records task wall time, every command run through
+# invoke or subprocess, time blocked in inquirer prompts, GitHub API
+# requests and task module imports, then writes a JSON trace and prints a
+# summary to stderr.
+
+ENV_VAR = "GTASKS_PROFILE"
+
+# inquirer functions that block on the user
+PROMPTS = [
+    "prompt",
+    "text",
+    "password",
+    "editor",
+    "confirm",
+    "list_input",
+    "checkbox",
+    "path",
+]
+
+events: List[Dict[str, Any]] = []
+active = False
+started = 0.0
+_depth = {"prompt": 0}
+
+
+def requested() -> bool:
+    """
+    Check whether profiling was requested through the environment.
+
+    Returns:
+        bool: True if `GTASKS_PROFILE` is set to a truthy value.
+    """
+
+    return os.environ.get(ENV_VAR, "").lower() not in ("", "0", "false", "no")
+
+
+def trace_path() -> str:
+    """
+    Get the path of the JSON trace.
+
+    Returns:
+        str: The path of the trace of the last profiled run.
+    """
+
+    return os.path.join(cache_dir(), "profile.json")
+
+
+@contextlib.contextmanager
+def record(
+    kind: str,
+    name: str,
+    **fields: Any,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block and record it as a trace event while the profiler is active.
+
+    Args:
+        kind (str): The kind of event, e.g. "task", "run", "subprocess", "prompt", "api" or "import".
+        name (str): The name of the event, e.g. the task name or the command.
+        **fields: Extra fields stored with the event.
+
+    Yields:
+        Dict[str, Any]: The event, so the block can add fields such as the exit code.
+    """
+
+    event = {"kind": kind, "name": name, **fields}
+    if not active:
+        yield event
+        return
+    # Events of background threads (e.g. prefetches) overlap with the main thread
+    event["main"] = threading.current_thread() is threading.main_thread()
+
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event["start"] = start - started
+        event["duration"] = time.perf_counter() - start
+        events.append(event)
+
+
+def _exit_code(
+    outcome: Any,
+) -> Any:
+    """Get the exit code of an invoke or subprocess result, or of the exception it raised."""
+
+    outcome = getattr(outcome, "result", outcome)
+    for attribute in ("exited", "returncode"):
+        if hasattr(outcome, attribute):
+            return getattr(outcome, attribute)
+    return None
+
+
+def _command(
+    command: Any,
+) -> str:
+    """Render a command given as a string or an argument list."""
+
+    if isinstance(command, (list, tuple)):
+        return " ".join(str(part) for part in command)
+    return str(command)
+
+
+def _wrap_command(
+    kind: str,
+    function: Callable,
+    command_index: int,
+) -> Callable:
+    """Wrap a function that runs a command so that every call is recorded."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if len(args) > command_index:
+            command = args[command_index]
+        else:
+            command = kwargs.get("command", kwargs.get("args", ""))
+        with record(kind, _command(command)) as event:
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                event["exit_code"] = _exit_code(error)
+                raise
+            event["exit_code"] = _exit_code(result)
+            return result
+
+    return wrapper
+
+
+def _wrap_prompt(
+    function: Callable,
+) -> Callable:
+    """Wrap an inquirer function so that the time spent waiting on the user is recorded."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # inquirer shortcuts may call each other; only time the outermost prompt
+        if _depth["prompt"]:
+            return function(*args, **kwargs)
+        message = args[0] if args and isinstance(args[0], str) else function.__name__
+        _depth["prompt"] += 1
+        try:
+            with record("prompt", message):
+                return function(*args, **kwargs)
+        finally:
+            _depth["prompt"] -= 1
+
+    return wrapper
+
+
+def _wrap_task(
+    function: Callable,
+) -> Callable:
+    """Wrap `Task.__call__` so that every task execution is recorded."""
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        with record("task", self.name):
+            return function(self, *args, **kwargs)
+
+    return wrapper
+
+
+def patch_inquirer() -> None:
+    """
+    Record the inquirer prompts.
+
+    Only patches inquirer once a task module has imported it, so profiling does not add its import cost.
+    """
+
+    inquirer = sys.modules.get("inquirer")
+    if inquirer is None or getattr(inquirer, "_gtasks_profiled", False):
+        return
+    for name in PROMPTS:
+        if hasattr(inquirer, name):
+            setattr(inquirer, name, _wrap_prompt(getattr(inquirer, name)))
+    inquirer._gtasks_profiled = True
+
+
+def start() -> None:
+    """
+    Start recording events.
+
+    Patches `Task.__call__`, `Runner.run` (used by `invoke.run` and `ctx.run`) and `subprocess.run`.
+    """
+
+    global active, started
+    if active:
+        return
+    active = True
+    started = time.perf_counter()
+    Task.__call__ = _wrap_task(Task.__call__)
+    Runner.run = _wrap_command("run", Runner.run, 1)
+    subprocess.run = _wrap_command("subprocess", subprocess.run, 0)
+    patch_inquirer()
+
+
+def main_thread_time(
+    kinds: tuple,
+) -> float:
+    """
+    Get the wall time the main thread spent in events of some kinds, counting overlapping events once.
+
+    Args:
+        kinds (tuple): The kinds of events, e.g. ("run", "prompt").
+
+    Returns:
+        float: The time in seconds.
+    """
+
+    intervals = sorted(
+        (e["start"], e["start"] + e["duration"])
+        for e in events
+        if e["kind"] in kinds and e.get("main", True)
+    )
+    busy = 0.0
+    end = float("-inf")
+    for start, stop in intervals:
+        if stop > end:
+            busy += stop - max(start, end)
+            end = stop
+
+    return busy
+
+
+def summary() -> str:
+    """
+    Summarize the recorded events.
+
+    The time the main thread did not spend in commands or prompts is reported as Python time.
+    Commands run in the background (e.g. a push during the PR prompts) are counted in the command
+    time but do not reduce the Python time.
+
+    Returns:
+        str: A human readable summary of the run.
+    """
+
+    total = time.perf_counter() - started
+    totals = {
+        kind: sum(e["duration"] for e in events if e["kind"] == kind)
+        for kind in ("import", "task", "run", "subprocess", "prompt", "api")
+    }
+    python = total - main_thread_time(("run", "subprocess", "prompt"))
+
+    lines = ["gtasks profile", ""]
+    lines.append(f"  {'total':<14}{total:9.3f}s")
+    lines.append(f"  {'imports':<14}{totals['import']:9.3f}s")
+    lines.append(f"  {'commands':<14}{totals['run'] + totals['subprocess']:9.3f}s")
+    lines.append(f"  {'prompts':<14}{totals['prompt']:9.3f}s")
+    lines.append(f"  {'python':<14}{python:9.3f}s")
+    # API requests run in-process and may overlap, so they are part of the Python time
+    requests = sum(e["kind"] == "api" for e in events)
+    if requests:
+        lines.append(f"  {'api':<14}{totals['api']:9.3f}s  ({requests} requests)")
+
+    for title, kinds in (
+        ("Tasks", ("task",)),
+        ("Commands", ("run", "subprocess")),
+        ("Prompts", ("prompt",)),
+        ("API requests", ("api",)),
+        ("Imports", ("import",)),
+    ):
+        selected = sorted(
+            (e for e in events if e["kind"] in kinds),
+            key=lambda e: e["duration"],
+            reverse=True,
+        )
+        if not selected:
+            continue
+        lines += ["", f"{title}:"]
+        for e in selected:
+            code = f" [exit {e['exit_code']}]" if e.get("exit_code") is not None else ""
+            code += f" [{e['status']}]" if e.get("status") is not None else ""
+            lines.append(f"  {e['duration']:9.3f}s  {e['name']}{code}")
+
+    return "\n".join(lines)
+
+
+def finish() -> None:
+    """
+    Stop recording, write the JSON trace and print the summary to stderr.
+
+    Does nothing if the profiler was not started.
+    """
+
+    global active
+    if not active:
+        return
+
+    report = summary()
+    active = False
+    path = trace_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(
+            path,
+            "w",
+        ) as file:
+            json.dump(
+                {"argv": sys.argv, "events": events},
+                file,
+                indent=2,
+                default=str,
+            )
+        report += f"\n\nTrace written to {path}"
+    except OSError as error:
+        report += f"\n\nCould not write the trace: {error}"
+
+    print(report, file=sys.stderr)
@@ -0,0 +1,122 @@
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Dict,
+    List,
+)
+
+from ._getowner import (
+    get_owner_repo,
+)
+from .github import (
+    graphql,
+)
+
+# This file contains the repository context: everything the tasks need to
+# know about a GitHub repository, fetched with a single GraphQL query and
+# shared by every task of the process.
+
+# Labels and collaborators are read from the cache first (see cache.py), the
+# ones fetched here are only used when the REST requests for them fail
+REPO_CONTEXT_QUERY = """
+query($owner: String!, $repo: String!) {
+  viewer { login }
+  repository(owner: $owner, name: $repo) {
+    defaultBranchRef { name }
+    labels(first: 100) { nodes { name color description } }
+    collaborators(first: 100) { nodes { login } }
+  }
+}
+"""
+
+
+@dataclass
+class RepoContext:
+    """Metadata of a GitHub repository used across tasks."""
+
+    owner: str
+    repo: str
+    viewer: str = ""
+    default_branch: str = "main"
+    labels: List[Dict[str, str]] = field(default_factory=list)
+    collaborators: List[str] = field(default_factory=list)
+
+
+# Contexts already fetched by this process, keyed by (owner, repo)
+_contexts: Dict[tuple, RepoContext] = {}
+
+
+def fetch_repo_context(
+    owner: str,
+    repo: str,
+) -> RepoContext:
+    """
+    Fetch the context of a repository with one GraphQL query.
+
+    Parts the user cannot read (e.g. collaborators without push access) are left empty.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The repository name.
+
+    Returns:
+        RepoContext: The context of the repository.
+
+    Raises:
+        RuntimeError: If the viewer or the repository could not be fetched.
+    """
+
+    data = graphql(
+        REPO_CONTEXT_QUERY,
+        owner=owner,
+        repo=repo,
+    )
+
+    repository = data.get("repository")
+    viewer = (data.get("viewer") or {}).get("login")
+    if not repository or not viewer:
+        raise RuntimeError(f"Could not fetch the repository {owner}/{repo} from GitHub")
+    labels = (repository.get("labels") or {}).get("nodes") or []
+    collaborators = (repository.get("collaborators") or {}).get("nodes") or []
+
+    return RepoContext(
+        owner=owner,
+        repo=repo,
+        viewer=viewer,
+        default_branch=(repository.get("defaultBranchRef") or {}).get("name", "main"),
+        labels=labels,
+        collaborators=[collaborator["login"] for collaborator in collaborators],
+    )
+
+
+def get_repo_context(
+    owner: str = None,
+    repo: str = None,
+) -> RepoContext:
+    """
+    Get the context of a repository, fetching it on first use.
+
+    Args:
+        owner (str, optional): The owner of the repository. Defaults to the current repository.
+        repo (str, optional): The repository name. Defaults to the current repository.
+
+    Returns:
+        RepoContext: The memoized context of the repository.
+
+    Raises:
+        RuntimeError: If the context could not be fetched. Failures are not memoized.
+    """
+
+    if owner is None or repo is None:
+        (
+            owner,
+            repo,
+        ) = get_owner_repo()
+
+    key = (owner, repo)
+    if key not in _contexts:
+        _contexts[key] = fetch_repo_context(owner, repo)
+
+    return _contexts[key]
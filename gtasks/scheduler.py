@@ -0,0 +1,219 @@
+import os
+import random
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+)
+
+# This file contains the scheduler every GitHub request goes through. It
+# caps the number of requests in flight, follows the X-RateLimit-* and
+# Retry-After headers, and retries throttled or failed requests with
+# exponential backoff and jitter. The concurrency limit is halved when
+# GitHub throttles and grows back by one with every successful request.
+
+CONCURRENCY_ENV_VAR = "GTASKS_GITHUB_CONCURRENCY"
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Server errors and connection failures (status 0) are worth retrying, but only for idempotent
+# requests: GitHub may have created an issue or PR before failing or timing out
+RETRY_STATUSES = {0, 500, 502, 503, 504}
+
+
+def is_throttled(
+    response: Any,
+) -> bool:
+    """
+    Check whether GitHub refused a request because of a primary or secondary rate limit.
+
+    Args:
+        response (Any): The response, with `status`, `headers` and `body`.
+
+    Returns:
+        bool: True if the request was rate limited.
+    """
+
+    if response.status == 429:
+        return True
+    if response.status != 403:
+        return False
+
+    return (
+        "retry-after" in response.headers
+        or response.headers.get("x-ratelimit-remaining") == "0"
+        or "rate limit" in response.body.lower()
+    )
+
+
+class Scheduler:
+    """Rate-limit-aware scheduler with adaptive concurrency."""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = MAX_RETRIES,
+    ) -> None:
+        # None reads GTASKS_GITHUB_CONCURRENCY on first use, so the children forked by the
+        # daemon follow the environment of their client rather than the one of the daemon
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self.remaining: Optional[int] = None
+        self.reset: Optional[float] = None
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def configure(self) -> None:
+        """Read the maximum concurrency from the environment if it was not given. Called with the condition held."""
+        if self.max_concurrency is None:
+            self.max_concurrency = max_concurrency()
+            self.limit = self.max_concurrency
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the state of the scheduler.
+
+        Returns:
+            Dict[str, Any]: The queue depth, the requests in flight, the current concurrency limit, the
+            remaining rate limit budget and when it resets (epoch seconds).
+        """
+
+        with self.condition:
+            self.configure()
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "concurrency": self.limit,
+                "remaining": self.remaining,
+                "reset": self.reset,
+            }
+
+    def acquire(self) -> None:
+        """Wait for a free slot, and for the end of any rate limit pause."""
+        with self.condition:
+            self.configure()
+            self.waiting += 1
+            while True:
+                pause = self.paused_until - time.time()
+                if pause <= 0 and self.in_flight < self.limit:
+                    break
+                self.condition.wait(pause if pause > 0 else None)
+            self.waiting -= 1
+            self.in_flight += 1
+
+    def release(
+        self,
+        response: Any,
+        delay: float,
+    ) -> None:
+        """Free a slot and adapt the concurrency and budget to the response."""
+        with self.condition:
+            self.in_flight -= 1
+            headers = response.headers
+            if "x-ratelimit-remaining" in headers:
+                self.remaining = int(headers["x-ratelimit-remaining"])
+            if "x-ratelimit-reset" in headers:
+                self.reset = float(headers["x-ratelimit-reset"])
+
+            if is_throttled(response):
+                self.limit = max(1, self.limit // 2)
+                self.paused_until = max(self.paused_until, time.time() + delay)
+            elif response.status < 400 and response.status != 0:
+                self.limit = min(self.max_concurrency, self.limit + 1)
+            if self.remaining == 0 and self.reset:
+                self.paused_until = max(self.paused_until, self.reset)
+            self.condition.notify_all()
+
+    def delay(
+        self,
+        response: Any,
+        attempt: int,
+    ) -> float:
+        """
+        Get how long to wait before retrying a request.
+
+        Args:
+            response (Any): The response of the failed attempt.
+            attempt (int): The number of the failed attempt, starting at 0.
+
+        Returns:
+            float: Retry-After if given, the time to the rate limit reset if the budget is spent,
+            otherwise an exponential backoff with full jitter.
+        """
+
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        if (
+            response.headers.get("x-ratelimit-remaining") == "0"
+            and "x-ratelimit-reset" in response.headers
+        ):
+            return max(0.0, float(response.headers["x-ratelimit-reset"]) - time.time())
+
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+    def submit(
+        self,
+        send: Callable[[], Any],
+        idempotent: bool = True,
+    ) -> Any:
+        """
+        Send a request once a slot is free, retrying throttled and failed attempts.
+
+        Rate limited requests are always retried, GitHub rejects them without acting on them. Server
+        errors and connection failures are only retried for idempotent requests.
+
+        Args:
+            send (Callable[[], Any]): Sends the request and returns the response.
+            idempotent (bool, optional): Whether sending the request twice has the same effect as once. Defaults to True.
+
+        Returns:
+            Any: The response of the last attempt.
+        """
+
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            response = None
+            try:
+                response = send()
+            finally:
+                retry = response is not None and (
+                    is_throttled(response) or (idempotent and response.status in RETRY_STATUSES)
+                )
+                delay = self.delay(response, attempt) if retry else 0.0
+                if response is None:
+                    with self.condition:
+                        self.in_flight -= 1
+                        self.condition.notify_all()
+                else:
+                    self.release(response, delay)
+            if not retry or attempt == self.max_retries:
+                return response
+            time.sleep(delay)
+
+        return response
+
+
+def max_concurrency() -> int:
+    """
+    Get the maximum number of GitHub requests in flight.
+
+    Returns:
+        int: `GTASKS_GITHUB_CONCURRENCY`, or 8 by default.
+    """
+
+    try:
+        return max(1, int(os.environ.get(CONCURRENCY_ENV_VAR, DEFAULT_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_CONCURRENCY
+
+
+scheduler = Scheduler()
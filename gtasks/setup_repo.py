@@ -1,10 +1,15 @@
-import json
 import subprocess
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
 from typing import (
     Dict,
     List,
     Union,
 )
+from urllib.parse import (
+    quote,
+)
 
 import inquirer
 from invoke import (
@@ -18,6 +23,11 @@ from invoke.tasks import (
 from ._getowner import (
     get_owner_repo,
 )
+from .github import (
+    MAX_WORKERS,
+    api,
+    fetch_pages,
+)
 
 # This file contains scripts related to setting up a repository.
 
@@ -75,19 +85,19 @@ def get_existing_labels(
 ]:
     """
     Get the existing labels in the repository.
-    This function uses the GitHub CLI to get the existing labels in the repository.
+    This function uses the GitHub API to get the existing labels in the repository.
     Args:
         owner (str): The owner of the repository.
         repo (str): The name of the repository.
     Returns:
         List[Dict[str, Union[str, int]]]: The list of existing labels in the repository.
     """
-    result = run(
-        f"gh api repos/{owner}/{repo}/labels",
-        hide=True,
+    pages = fetch_pages(
+        f"repos/{owner}/{repo}/labels",
+        lambda items: items,
+        [],
     )
-    existing_labels = result.stdout
-    return json.loads(existing_labels)  # type: List[Dict[str, Union[str, int]]]
+    return [label for page in pages or [] for label in page["data"]]
 
 
 @task
@@ -96,7 +106,7 @@ def labels(
 ) -> None:
     """
     Set up the labels in the repository.
-    This function uses the GitHub CLI to delete the existing labels in the repository and create new labels based on the `labels_list` defined in the script.
+    This function uses the GitHub API to delete the existing labels in the repository and create new labels based on the `labels_list` defined in the script.
     Returns:
         None
     """
@@ -115,35 +125,30 @@ def labels(
 
     
 
-    for label in existing_labels:
-        subprocess.run(
-            [
-                "gh",
-                "label",
-                "delete",
-                label["name"],
-                "--repo",
-                f"{owner}/{repo}",
-                "--yes",  # Automatically confirm deletion
-            ]
+    def delete(label: Dict[str, Union[str, int]]) -> None:
+        response = api(
+            "DELETE",
+            f"repos/{owner}/{repo}/labels/{quote(label['name'], safe='')}",
         )
+        if response.status != 204:
+            print(f"Could not delete label {label['name']}: {response.status} {response.body}")
+
+    def create(label: Dict[str, str]) -> None:
+        response = api(
+            "POST",
+            f"repos/{owner}/{repo}/labels",
+            label,
+        )
+        if response.status != 201:
+            print(f"Could not create label {label['name']}: {response.status} {response.body}")
+
+    # The requests run concurrently, within the limits of the GitHub scheduler
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        list(pool.map(delete, existing_labels))
 
     # Update with the provided labels
-    for label in labels_list:
-        subprocess.run(
-            [
-                "gh",
-                "label",
-                "create",
-                label["name"],
-                "--color",
-                label["color"],
-                "--description",
-                label["description"],
-                "--repo",
-                f"{owner}/{repo}",
-            ]
-        )
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        list(pool.map(create, labels_list))
 
 
 def create_submodules():
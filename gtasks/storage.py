@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    List,
+    Optional,
+)
+
+# sqlite3 is only imported when a database is opened, so modules loaded by
+# --list (e.g. the manifest) do not pay for it
+if TYPE_CHECKING:
+    import sqlite3
+
+# This file contains the helpers shared by the files gtasks keeps under its
+# cache directory: JSON files replaced atomically, and SQLite databases with
+# a schema version and a metadata table.
+
+
+def write_json(
+    path: str,
+    data: Any,
+) -> bool:
+    """
+    Write a JSON file atomically, creating its directory if needed.
+
+    The data is written to a temporary file next to the path, then moved over it, so readers
+    (possibly in other processes) never see a partially written file. Errors are ignored: the
+    files gtasks writes this way are optimizations it works without.
+
+    Args:
+        path (str): The path of the file.
+        data (Any): The data to write.
+
+    Returns:
+        bool: Whether the file was written.
+    """
+
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        text = json.dumps(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(
+            temporary,
+            "w",
+        ) as file:
+            file.write(text)
+        os.replace(temporary, path)
+    except (OSError, TypeError, ValueError):
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        return False
+
+    return True
+
+
+def connect_db(
+    path: str,
+    schema: str,
+    version: int,
+    tables: List[str],
+) -> "sqlite3.Connection":
+    """
+    Open a SQLite database, creating it if needed.
+
+    Args:
+        path (str): The path of the database.
+        schema (str): The statements creating its tables, run every time.
+        version (int): The version of the schema. Databases of another version are rebuilt.
+        tables (List[str]): The tables dropped to rebuild the database.
+
+    Returns:
+        sqlite3.Connection: The connection, with rows accessible by column name.
+    """
+
+    import sqlite3
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    db.row_factory = sqlite3.Row
+    # WAL lets a task read the database while a background task writes to it
+    db.execute("PRAGMA journal_mode=WAL")
+    if db.execute("PRAGMA user_version").fetchone()[0] != version:
+        db.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in tables))
+        db.execute(f"PRAGMA user_version = {version}")
+    db.executescript(schema)
+
+    return db
+
+
+def get_meta(
+    db: "sqlite3.Connection",
+    key: str,
+) -> Optional[str]:
+    """Get a value of the metadata table, None if it is not set."""
+    row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def set_meta(
+    db: "sqlite3.Connection",
+    key: str,
+    value: str,
+) -> None:
+    """Set a value of the metadata table."""
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,87 @@
+import http.server
+import json
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Tuple,
+)
+
+import pytest
+
+from gtasks import (
+    github,
+    scheduler,
+)
+
+# A route answers (method, path, headers, body) with (status, headers, body)
+Route = Callable[[str, str, Dict[str, str], Any], Tuple[int, Dict[str, str], Any]]
+
+
+class FakeGitHub(http.server.ThreadingHTTPServer):
+    """A local HTTP server standing in for the GitHub API."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.route: Route = lambda method, path, headers, body: (404, {}, {"message": "Not Found"})
+        self.requests: List[Tuple[str, str, Dict[str, str], Any]] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def answer(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, headers, body))
+        status, reply_headers, reply = self.server.route(self.command, self.path, headers, body)
+
+        data = b"" if reply is None else json.dumps(reply).encode()
+        self.send_response(status)
+        for key, value in reply_headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = answer
+
+
+@pytest.fixture
+def fake_github(monkeypatch, tmp_path):
+    server = FakeGitHub()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+
+    monkeypatch.setenv(github.API_URL_ENV_VAR, server.url)
+    monkeypatch.setenv("GH_TOKEN", "test-token")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    # A fresh client and scheduler per test, retrying without waiting
+    monkeypatch.setattr(github, "_client", {})
+    monkeypatch.setattr(github, "scheduler", scheduler.Scheduler(4))
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE", 0.001)
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,118 @@
+import urllib.parse
+
+import pytest
+
+from gtasks import (
+    cache,
+    github,
+)
+
+
+def paginated(items, path):
+    """Answer a list request like GitHub, with a Link header to the last page."""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+    per_page = int(query.get("per_page", ["30"])[0])
+    page = int(query.get("page", ["1"])[0])
+    last = max(1, -(-len(items) // per_page))
+    link = f'<https://api.github.com/x?per_page={per_page}&page={last}>; rel="last"'
+
+    return 200, {"Link": link}, items[(page - 1) * per_page : page * per_page]
+
+
+def test_api_sends_token_and_reuses_connection(fake_github):
+    fake_github.route = lambda method, path, headers, body: (200, {}, {"login": "octocat"})
+
+    for _ in range(3):
+        response = github.api("GET", "user")
+
+    assert response.status == 200
+    assert response.json() == {"login": "octocat"}
+    assert fake_github.requests[0][2]["authorization"] == "token test-token"
+    assert fake_github.connections == 1
+
+
+def test_api_sends_json_body(fake_github):
+    fake_github.route = lambda method, path, headers, body: (201, {}, {"number": 1, **body})
+
+    response = github.api("POST", "repos/o/r/issues", {"title": "Crash"})
+
+    assert response.status == 201
+    assert fake_github.requests == [
+        ("POST", "/repos/o/r/issues", fake_github.requests[0][2], {"title": "Crash"})
+    ]
+
+
+def test_fetch_page_parses_last_page(fake_github):
+    items = [{"id": n} for n in range(250)]
+    fake_github.route = lambda method, path, headers, body: paginated(items, path)
+
+    status, _, page, last = github.fetch_page("repos/o/r/labels", 2)
+
+    assert status == 200
+    assert [item["id"] for item in page] == list(range(100, 200))
+    assert last == 3
+
+
+def test_fetch_page_keeps_query_string(fake_github):
+    fake_github.route = lambda method, path, headers, body: paginated([], path)
+
+    github.fetch_page("repos/o/r/issues?state=all", 1)
+
+    assert fake_github.requests[0][1] == "/repos/o/r/issues?state=all&per_page=100&page=1"
+
+
+def test_fetch_pages_fetches_every_page(fake_github):
+    items = [{"id": n} for n in range(250)]
+    fake_github.route = lambda method, path, headers, body: paginated(items, path)
+
+    pages = github.fetch_pages("repos/o/r/labels", lambda page: page, [])
+
+    assert [item["id"] for page in pages for item in page["data"]] == list(range(250))
+
+
+def test_iter_pages_raises_on_failure(fake_github):
+    fake_github.route = lambda method, path, headers, body: (404, {}, {"message": "Not Found"})
+
+    with pytest.raises(RuntimeError):
+        list(github.iter_pages("repos/o/r/issues"))
+
+
+def test_revalidate_uses_cached_pages_on_304(fake_github):
+    labels = [{"name": "bug", "color": "d73a4a", "description": "Something is broken"}]
+
+    def route(method, path, headers, body):
+        if headers.get("if-none-match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, None
+        return 200, {"ETag": '"v1"'}, labels
+
+    fake_github.route = route
+
+    assert cache.revalidate("o", "r", "labels") == labels
+    entry = cache.load_entry("o", "r", "labels")
+    assert cache.revalidate("o", "r", "labels", entry) == labels
+    assert fake_github.requests[1][2]["if-none-match"] == '"v1"'
+
+
+def test_graphql_returns_data(fake_github):
+    fake_github.route = lambda method, path, headers, body: (
+        200,
+        {},
+        {"data": {"viewer": {"login": body["variables"]["login"]}}},
+    )
+
+    assert github.graphql("query($login: String!) { viewer { login } }", login="octocat") == {
+        "viewer": {"login": "octocat"}
+    }
+    assert fake_github.requests[0][:2] == ("POST", "/graphql")
+
+
+def test_graphql_strict_raises_on_errors(fake_github):
+    fake_github.route = lambda method, path, headers, body: (
+        200,
+        {},
+        {"data": None, "errors": [{"message": "bad"}]},
+    )
+
+    assert github.graphql("query { viewer { login } }") == {}
+    with pytest.raises(RuntimeError, match="bad"):
+        github.graphql_strict("query { viewer { login } }")
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+
+from gtasks import (
+    github,
+    scheduler,
+)
+
+
+def throttle_first(status, headers, body=None):
+    """Answer the first request with a rate limit rejection, and the next ones with 200."""
+    calls = []
+
+    def route(method, path, request_headers, request_body):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return status, headers, body or {"message": "You have exceeded a secondary rate limit"}
+        return 200, {"X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": "1700000000"}, {}
+
+    return route, calls
+
+
+def test_retry_after_is_honored(fake_github):
+    fake_github.route, calls = throttle_first(429, {"Retry-After": "1"})
+
+    response = github.api("GET", "user")
+
+    assert response.status == 200
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.9
+
+
+def test_secondary_rate_limit_403_is_retried(fake_github):
+    fake_github.route, calls = throttle_first(403, {})
+
+    assert github.api("POST", "repos/o/r/issues", {"title": "t"}).status == 200
+    assert len(calls) == 2
+
+
+def test_plain_403_is_not_retried(fake_github):
+    fake_github.route = lambda method, path, headers, body: (
+        403,
+        {},
+        {"message": "Must have admin rights"},
+    )
+
+    assert github.api("GET", "repos/o/r/collaborators").status == 403
+    assert len(fake_github.requests) == 1
+
+
+def test_server_errors_are_only_retried_when_idempotent(fake_github):
+    fake_github.route = lambda method, path, headers, body: (502, {}, {})
+
+    assert github.api("POST", "repos/o/r/issues", {"title": "t"}).status == 502
+    assert len(fake_github.requests) == 1
+
+    fake_github.requests.clear()
+    assert github.api("GET", "repos/o/r/issues").status == 502
+    assert len(fake_github.requests) == github.scheduler.max_retries + 1
+
+
+def test_concurrency_is_halved_and_recovers(fake_github):
+    fake_github.route, _ = throttle_first(429, {"Retry-After": "0"})
+
+    github.api("GET", "user")
+    assert github.scheduler.stats()["concurrency"] == 3
+
+    github.api("GET", "user")
+    assert github.scheduler.stats()["concurrency"] == 4
+
+
+def test_concurrency_is_capped(fake_github):
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def route(method, path, headers, body):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.05)
+        with lock:
+            state["in_flight"] -= 1
+        return 200, {}, {}
+
+    fake_github.route = route
+    github.scheduler = scheduler.Scheduler(2)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: github.api("GET", "user"), range(8)))
+
+    assert state["peak"] == 2
+
+
+def test_stats_report_budget_and_queue(fake_github):
+    fake_github.route = lambda method, path, headers, body: (
+        200,
+        {"X-RateLimit-Remaining": "42", "X-RateLimit-Reset": "1700000000"},
+        {},
+    )
+
+    github.api("GET", "user")
+
+    assert github.scheduler.stats() == {
+        "queue_depth": 0,
+        "in_flight": 0,
+        "concurrency": 4,
+        "remaining": 42,
+        "reset": 1700000000.0,
+    }
+
+
+def test_concurrency_is_read_from_the_environment_on_first_use(monkeypatch):
+    lazy = scheduler.Scheduler()
+    monkeypatch.setenv(scheduler.CONCURRENCY_ENV_VAR, "3")
+
+    assert lazy.stats()["concurrency"] == 3